@@ -1,45 +1,236 @@
-from numpy import array
+from functools import cached_property
+import json
+import os
 import numpy as np
 import pandas as pd
 from pandas.core.frame import DataFrame
 
 
 class CarbonModel():
+    """Carbon intensity trace stored as a step function, one sample every `scale` time indices.
+    Point, window and argmin queries are answered from the samples and their prefix sums, the trace is never expanded per time index.
+    """
 
-    def __init__(self, name, df: DataFrame, carbon_start_index, carbon_error) -> None:
+    def __init__(self, name, df: DataFrame, carbon_start_index, carbon_error, scale=1) -> None:
         self.name = name
-        self.df = df
         self.carbon_start_index = carbon_start_index
         self.carbon_error = carbon_error
-        self.mean = self.df["carbon_intensity_avg"].mean()
-        self.std = self.df["carbon_intensity_avg"].std()
+        self.samples = df["carbon_intensity_avg"].to_numpy(dtype=float)
+        self.scale = scale
+        # carbon intensity of each time index covered by a sample
+        self.rates = self.samples / scale
+        # first time index of each sample, the last entry is the trace length
+        self.boundaries = np.ceil(np.arange(len(self.samples) + 1) * scale).astype(int)
+        # prefix sums, prefix[i] is the carbon of the time indices before sample i
+        self.prefix = np.concatenate(([0.0], np.cumsum(self.rates * np.diff(self.boundaries))))
+        self.offset = 0
+        self.length = int(self.boundaries[-1])
+
+    @cached_property
+    def mean(self):
+        rates, counts = self._blocks(self.offset, self.offset + len(self))
+        return (rates * counts).sum() / counts.sum()
+
+    @cached_property
+    def std(self):
+        rates, counts = self._blocks(self.offset, self.offset + len(self))
+        return np.sqrt((counts * (rates - self.mean) ** 2).sum() / (counts.sum() - 1))
 
     def reindex(self, index):
-        df = self.df[index:].copy().reset_index()
-        model = CarbonModel(self.name, df, self.carbon_start_index, self.carbon_error)
-        return model
+        return CarbonModelView(self, index, len(self))
 
     def subtrace(self, start_index, end_index):
-        df = self.df[start_index: end_index].copy().reset_index()
-        model = CarbonModel(self.name, df,self.carbon_start_index, self.carbon_error)
-        return model
-    
+        return CarbonModelView(self, start_index, end_index)
+
     def extend(self, factor):
-        df = pd.DataFrame(np.repeat(self.df.values, factor, axis=0), columns=["carbon_intensity_avg"])
-        df["carbon_intensity_avg"] /= factor
-        model = CarbonModel(self.name, df,self.carbon_start_index, self.carbon_error)
-        return model
-        
+        """Stretch every sample over `factor` times more time indices, the carbon intensity per time index is divided accordingly
+
+        Args:
+            factor (float): time indices per time index of the current trace
+
+        Returns:
+            CarbonModel: extended trace
+        """
+        df = pd.DataFrame(self.samples, columns=["carbon_intensity_avg"])
+        return CarbonModel(self.name, df, self.carbon_start_index, self.carbon_error, self.scale * factor)
+
+    def _sample(self, index):
+        """Sample covering each (absolute) time index"""
+        return np.minimum(np.searchsorted(self.boundaries, index, side="right") - 1, len(self.samples) - 1)
+
+    def _cumulative(self, index):
+        """Carbon of the (absolute) time indices before `index`"""
+        sample = self._sample(index)
+        return self.prefix[sample] + (index - self.boundaries[sample]) * self.rates[sample]
+
+    def _blocks(self, start_index, end_index):
+        """Samples overlapping the (absolute) window [start_index, end_index) and their number of time indices inside it"""
+        first = self._sample(start_index)
+        last = self._sample(max(end_index - 1, start_index))
+        counts = np.minimum(self.boundaries[first + 1:last + 2], end_index) - np.maximum(
+            self.boundaries[first:last + 1], start_index)
+        return self.rates[first:last + 1], np.maximum(counts, 0)
+
+    def window_carbon(self, start_index, end_index):
+        """Total carbon intensity of [start_index, end_index) in constant time, indices are clipped to the trace like a slice
+
+        Args:
+            start_index (int|np.ndarray): first time index
+            end_index (int|np.ndarray): time index after the last one
+
+        Returns:
+            float|np.ndarray: carbon intensity sum
+        """
+        start_index = np.clip(start_index, 0, len(self))
+        end_index = np.clip(end_index, start_index, len(self))
+        return self._cumulative(self.offset + end_index) - self._cumulative(self.offset + start_index)
+
+    def lowest_carbon_index(self, start_index, end_index) -> int:
+        """First time index with the lowest carbon intensity in [start_index, end_index), like `np.argmin` over the window
+
+        Args:
+            start_index (int): first time index
+            end_index (int): time index after the last one, clipped to the trace
+
+        Returns:
+            int: time index
+        """
+        start_index = self.offset + start_index
+        end_index = self.offset + min(end_index, len(self))
+        assert start_index < end_index, "Empty carbon window"
+        rates, counts = self._blocks(start_index, end_index)
+        first = self._sample(start_index)
+        sample = first + int(np.argmin(np.where(counts > 0, rates, np.inf)))
+        return max(int(self.boundaries[sample]), start_index) - self.offset
+
+    def steps(self):
+        """Constant pieces of the trace
+
+        Returns:
+            np.ndarray: first time index of each piece
+            np.ndarray: number of time indices of each piece
+            np.ndarray: carbon intensity of each piece
+        """
+        rates, counts = self._blocks(self.offset, self.offset + len(self))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        keep = counts > 0
+        return starts[keep], counts[keep], rates[keep]
+
+    def quantile(self, q: float):
+        """Same value as `np.quantile(self.values, q)` (linear method), computed from the constant pieces of the trace
+
+        Args:
+            q (float): quantile in [0, 1]
+
+        Returns:
+            float: carbon intensity quantile
+        """
+        _, counts, rates = self.steps()
+        order = np.argsort(rates, kind="stable")
+        rates, upper = rates[order], np.cumsum(counts[order])
+        virtual_index = (len(self) - 1) * q
+        previous_index = int(np.floor(virtual_index))
+        a = rates[np.searchsorted(upper, previous_index, side="right")]
+        b = rates[np.searchsorted(upper, min(previous_index + 1, len(self) - 1), side="right")]
+        # numpy's interpolation, from the closest sample
+        gamma = virtual_index - previous_index
+        if gamma >= 0.5:
+            return b - (b - a) * (1 - gamma)
+        return a + (b - a) * gamma
+
+    @property
+    def values(self):
+        """Carbon intensity of each time index, expanded on access so only meant for short windows"""
+        return self.rates[self._sample(np.arange(self.offset, self.offset + len(self)))]
+
+    def to_frame(self) -> DataFrame:
+        """Copy the trace into a DataFrame, `index` holds the time index of the full trace
+
+        Returns:
+            DataFrame: carbon intensity per time index
+        """
+        return pd.DataFrame(
+            {
+                "index": np.arange(self.offset, self.offset + len(self)),
+                "carbon_intensity_avg": self.values,
+            }
+        )
+
+    def __len__(self):
+        return self.length
 
     def __getitem__(self, index):
-        return self.df.iloc[index]['carbon_intensity_avg']
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self.subtrace(start, stop).values[::step]
+        index = np.where(np.asarray(index) < 0, np.asarray(index) + len(self), index)
+        return self.rates[self._sample(self.offset + index)]
+
+
+class CarbonModelView(CarbonModel):
+    """Window of a carbon model that shares the parent samples, nothing is copied or recomputed
+
+    Args:
+        model (CarbonModel): parent model or view
+        start_index (int): first time index of the window in the parent
+        end_index (int): time index after the window in the parent
+    """
+
+    def __init__(self, model: CarbonModel, start_index, end_index) -> None:
+        end_index = min(end_index, len(model))
+        start_index = min(start_index, end_index)
+        self.name = model.name
+        self.carbon_start_index = model.carbon_start_index
+        self.carbon_error = model.carbon_error
+        self.samples = model.samples
+        self.scale = model.scale
+        self.rates = model.rates
+        self.boundaries = model.boundaries
+        self.prefix = model.prefix
+        self.offset = model.offset + start_index
+        self.length = end_index - start_index
+
+    def extend(self, factor):
+        raise ValueError("Extend the full trace before taking windows")
+
+
+def load_carbon_trace(carbon_trace: str) -> np.ndarray:
+    """Carbon intensity column of a carbon trace, converted once to a `.npy` cache under `src/traces/.cache`.
+    The cache is memory-mapped read-only so loading a window is a slice that processes share through the page cache,
+    it is rebuilt when the csv size or modification time changes.
+
+    Args:
+        carbon_trace (str): carbon trace name
+
+    Returns:
+        np.ndarray: carbon intensity per hour
+    """
+    csv_file = f"src/traces/{carbon_trace}.csv"
+    cache_file = f"src/traces/.cache/{carbon_trace}.npy"
+    metadata_file = f"src/traces/.cache/{carbon_trace}.json"
+    stat = os.stat(csv_file)
+    source = {"source": csv_file, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+        if all(metadata.get(key) == value for key, value in source.items()):
+            return np.load(cache_file, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    values = pd.read_csv(csv_file, usecols=["carbon_intensity_avg"])["carbon_intensity_avg"].to_numpy(dtype=float)
+    os.makedirs("src/traces/.cache", exist_ok=True)
+    # write to temporary files and rename so concurrent experiments never read a partial cache
+    np.save(f"{cache_file}.{os.getpid()}.npy", values)
+    os.replace(f"{cache_file}.{os.getpid()}.npy", cache_file)
+    with open(f"{metadata_file}.{os.getpid()}", "w") as f:
+        json.dump({**source, "column": "carbon_intensity_avg", "dtype": str(values.dtype), "length": len(values)}, f)
+    os.replace(f"{metadata_file}.{os.getpid()}", metadata_file)
+    return np.load(cache_file, mmap_mode="r")
 
 
 def get_carbon_model(carbon_trace:str, carbon_start_index:int, carbon_error="ORACLE") -> CarbonModel:
-    df = pd.read_csv(f"src/traces/{carbon_trace}.csv")
-    df = df[17544+carbon_start_index:17544+carbon_start_index+720]
-    #df = pd.concat([df.copy(), df[:1000].copy()]).reset_index()
-    df = df[["carbon_intensity_avg"]]
-    df["carbon_intensity_avg"] /= 1000
+    values = load_carbon_trace(carbon_trace)
+    values = values[17544+carbon_start_index:17544+carbon_start_index+720]
+    df = pd.DataFrame(values / 1000, columns=["carbon_intensity_avg"])
     c = CarbonModel(carbon_trace, df, carbon_start_index, carbon_error)
     return c
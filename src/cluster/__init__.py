@@ -4,7 +4,7 @@ from .base_cluster import BaseCluster
 from .base_cluster import ON_DEMAND_COST_HOUR
 
 
-def create_cluster(cluster_type: str, scheduling_policy: str, carbon_model: CarbonModel, reserved_instances: int, experiment_name: str, waiting_times_str: str, cluster_partition: str):
+def create_cluster(cluster_type: str, scheduling_policy: str, carbon_model: CarbonModel, reserved_instances: int, experiment_name: str, waiting_times_str: str, cluster_partition: str, slurm_backend: str = "pyslurm", fake_options: dict = None, job_profile: str = "nbody100k", time_limit_percentile: int = None):
     """Create Cluster Instance (Simulation and Real)
 
     Args:
@@ -15,6 +15,10 @@ def create_cluster(cluster_type: str, scheduling_policy: str, carbon_model: Carb
         experiment_name (str): Hashed Configuration of tracking slurm tasks
         waiting_times_str (str): waiting times per queue
         cluster_partition (str): used cluster partition (queue), only for slurm experiments
+        slurm_backend (str): Slurm backend ("pyslurm"|"fake"), only for slurm experiments
+        fake_options (dict): settings of the fake Slurm backend, see FakeSlurmBackend
+        job_profile (str): profile in `jobs/profiles` of the job submitted for each task, only for slurm experiments
+        time_limit_percentile (int): iteration time percentile of the job time limits, defaults to the mean
 
     Raises:
         Exception: Wrong Configuration
@@ -26,10 +30,14 @@ def create_cluster(cluster_type: str, scheduling_policy: str, carbon_model: Carb
         return SimulationCluster(reserved_instances, carbon_model, experiment_name, "spot" in scheduling_policy)
     elif cluster_type == "slurm":
         from .slurm_cluster import SlurmCluster
+        from .slurm_backend import create_slurm_backend
+        backend = create_slurm_backend(slurm_backend, fake_options)
         if "spot" in scheduling_policy:
-            return SlurmCluster(reserved_instances, carbon_model, experiment_name, cluster_partition, True)
+            return SlurmCluster(reserved_instances, carbon_model, experiment_name, cluster_partition, True, backend,
+                                job_profile, time_limit_percentile)
         else:
-            return SlurmCluster(reserved_instances, carbon_model, experiment_name, cluster_partition, False)
+            return SlurmCluster(reserved_instances, carbon_model, experiment_name, cluster_partition, False, backend,
+                                job_profile, time_limit_percentile)
 
     else:
         raise Exception("Not Implemented")
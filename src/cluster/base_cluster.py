@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 import os
 
+import numpy as np
 import pandas as pd
 from carbon import CarbonModel
 from task import Task, TIME_FACTOR
@@ -37,17 +38,22 @@ class BaseCluster(ABC):
         self.carbon_model = carbon_model
         self.details = []
         self.experiment_name = experiment_name
-        self.runtime_allocation = [0] * carbon_model.df.shape[0]
+        # difference array of the allocated CPUs, prefix-summed in save_results
+        self.runtime_allocation = np.zeros(len(carbon_model) + 1, dtype=np.int32)
         self.lock = Lock()
         self.allow_spot = allow_spot
 
     @abstractmethod
-    def submit(self, current_time, task: Task):
-        """Submit Tasks to the Cluster Queue
+    def submit(self, current_time, task: Task, task_length=None, task_length_class=None, arrival_time=None):
+        """Submit Tasks to the Cluster Queue. Suspend-resume intervals are submitted as their task with
+        the interval length, length class and submission time overriding the task attributes.
 
         Args:
             current_time (int): Time index
             task (Task): Submitted Task
+            task_length (int): interval length, defaults to the task length
+            task_length_class (str): interval length class, defaults to the task length class
+            arrival_time (int): interval arrival time, defaults to the task arrival time
         """
         pass
 
@@ -60,19 +66,34 @@ class BaseCluster(ABC):
         """
         pass
 
-    def log_task(self, start_time, task: Task, dollar_cost, carbon, reason="completed"):
-        waiting_time = start_time - task.arrival_time
-        exit_time = start_time + task.task_length
+    def next_event_time(self, current_time):
+        """Next time index at which the cluster state may change, tick-based clusters return the next tick
+
+        Args:
+            current_time (int): time index
+
+        Returns:
+            int: next event time index, None if the cluster is idle
+        """
+        return current_time + 1
+
+    def log_task(self, start_time, task: Task, dollar_cost, carbon, reason="completed", task_length=None,
+                 task_length_class=None, arrival_time=None):
+        task_length = task.task_length if task_length is None else task_length
+        task_length_class = task.task_length_class if task_length_class is None else task_length_class
+        arrival_time = task.arrival_time if arrival_time is None else arrival_time
+        waiting_time = start_time - arrival_time
+        exit_time = start_time + task_length
         self.max_time = max(self.max_time, start_time)
-        for i in range(start_time, exit_time + 1):
-            self.runtime_allocation[i] += task.CPUs
+        self.runtime_allocation[start_time] += task.CPUs
+        self.runtime_allocation[min(exit_time + 1, len(self.carbon_model))] -= task.CPUs
         self.details.append(
             [
                 task.ID,
-                task.arrival_time,
-                task.task_length,
+                arrival_time,
+                task_length,
                 task.CPUs,
-                task.task_length_class,
+                task_length_class,
                 task.CPUs_class,
                 carbon,
                 dollar_cost,
@@ -148,8 +169,9 @@ class BaseCluster(ABC):
         os.makedirs(f"results/{cluster_type}/{task_trace}/", exist_ok=True)
         file_name = f"results/{cluster_type}/{task_trace}/details-{scheduling_policy}-{self.carbon_model.carbon_start_index}-{carbon_policy}-{carbon_trace}-{self.total_reserved_instances}-{waiting_times_str}.csv"
         df.to_csv(file_name, index=False)
-        runtime_df = pd.DataFrame(self.runtime_allocation, columns=["cpus"])
-        runtime_df["time"] = range(self.carbon_model.df.shape[0])
+        runtime_df = pd.DataFrame(
+            np.cumsum(self.runtime_allocation[:-1], dtype=np.int32), columns=["cpus"])
+        runtime_df["time"] = range(len(self.carbon_model))
         runtime_df["time"] //= 60
         runtime_df = runtime_df.groupby("time").mean().reset_index()
         file_name = f"results/{cluster_type}/{task_trace}/runtime-{scheduling_policy}-{self.carbon_model.carbon_start_index}-{carbon_policy}-{carbon_trace}-{self.total_reserved_instances}-{waiting_times_str}.csv"
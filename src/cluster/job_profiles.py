@@ -0,0 +1,96 @@
+from typing import Dict
+import os
+import pandas as pd
+
+PERCENTILES = [50, 90, 99]
+
+
+class JobProfile:
+    """Mean and percentile iteration times of a job by node count, from a `nodes,iteration_time` profile csv
+
+    Args:
+        file_name (str): profile csv
+        fingerprint (tuple): size and modification time of the profile when it is read
+    """
+
+    def __init__(self, file_name: str, fingerprint: tuple) -> None:
+        self.file_name = file_name
+        self.fingerprint = fingerprint
+        iteration_times = pd.read_csv(file_name).groupby("nodes")["iteration_time"]
+        self.mean: Dict[int, float] = {nodes: times.mean() for nodes, times in iteration_times}
+        self.percentiles: Dict[int, Dict[int, float]] = {
+            q: iteration_times.quantile(q / 100).to_dict() for q in PERCENTILES
+        }
+
+    def iteration_time(self, nodes: int) -> float:
+        """Mean iteration time of the job on `nodes` nodes
+
+        Args:
+            nodes (int): node count
+
+        Raises:
+            ValueError: the node count was not profiled
+
+        Returns:
+            float: seconds per iteration
+        """
+        if nodes not in self.mean:
+            raise ValueError(f"{self.file_name} has no profile for {nodes} nodes")
+        return self.mean[nodes]
+
+    def percentile(self, nodes: int, q: int) -> float:
+        """Percentile iteration time of the job on `nodes` nodes
+
+        Args:
+            nodes (int): node count
+            q (int): one of PERCENTILES
+
+        Raises:
+            ValueError: the node count was not profiled or `q` is not precomputed
+
+        Returns:
+            float: seconds per iteration
+        """
+        if q not in self.percentiles:
+            raise ValueError(f"Percentile {q} is not one of {PERCENTILES}")
+        if nodes not in self.percentiles[q]:
+            raise ValueError(f"{self.file_name} has no profile for {nodes} nodes")
+        return self.percentiles[q][nodes]
+
+
+class JobProfiles:
+    """Job profiles by name, each read once from `<profile_dir>/<name>.csv` and read again when the file changes
+
+    Args:
+        profile_dir (str): profiles directory
+    """
+
+    def __init__(self, profile_dir: str = "jobs/profiles") -> None:
+        self.profile_dir = profile_dir
+        self.profiles: Dict[str, JobProfile] = {}
+
+    def get(self, name: str) -> JobProfile:
+        """Profile of a job, e.g. nbody100k
+
+        Args:
+            name (str): profile name
+
+        Returns:
+            JobProfile: job profile
+        """
+        file_name = f"{self.profile_dir}/{name}.csv"
+        stat = os.stat(file_name)
+        fingerprint = (stat.st_size, stat.st_mtime_ns)
+        profile = self.profiles.get(name)
+        if profile is None or profile.fingerprint != fingerprint:
+            profile = JobProfile(file_name, fingerprint)
+            self.profiles[name] = profile
+        return profile
+
+    def iteration_time(self, name: str, nodes: int) -> float:
+        """Mean iteration time of a job on `nodes` nodes, see `JobProfile.iteration_time`"""
+        return self.get(name).iteration_time(nodes)
+
+    def percentile(self, name: str, nodes: int, q: int) -> float:
+        """Percentile iteration time of a job on `nodes` nodes, see `JobProfile.percentile`"""
+        return self.get(name).percentile(nodes, q)
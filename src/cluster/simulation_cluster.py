@@ -1,6 +1,8 @@
-from scheduling.carbon_waiting_policy import compute_carbon_consumption
+from typing import List
 from task import Task
 from .base_cluster import BaseCluster
+import heapq
+import numpy as np
 import pandas as pd
 import os
 
@@ -16,22 +18,27 @@ class SimulationCluster(BaseCluster):
             allow_spot=allow_spot,
         )
         self.release_instance = {}
+        self.last_release = None
 
-    def submit(self, current_time, task):
+    def submit(self, current_time, task, task_length=None, task_length_class=None, arrival_time=None):
         try:
-            c_model = self.carbon_model.subtrace(
-                current_time, current_time + max(task.task_length, task.expected_time)
-            )
-            schedule = compute_carbon_consumption(task, 0, c_model)
-            finish_time = schedule.actual_finish_time(current_time)
-            if self.allow_spot and task.task_length_class == "0-2":
-                self.total_carbon_cost += schedule.carbon_cost
-                self.total_dollar_cost += task.CPUs * task.task_length * self.spot_cost
+            task_length = task.task_length if task_length is None else task_length
+            task_length_class = task.task_length_class if task_length_class is None else task_length_class
+            assert current_time + task_length <= len(self.carbon_model), "Trace is shorter than task"
+            carbon_cost = self.carbon_model.window_carbon(
+                current_time, current_time + task_length) * task.CPUs  # 1 watt per core for now
+            finish_time = current_time + task_length
+            if self.allow_spot and task_length_class == "0-2":
+                self.total_carbon_cost += carbon_cost
+                self.total_dollar_cost += task.CPUs * task_length * self.spot_cost
                 self.log_task(
                     current_time,
                     task,
-                    task.CPUs * task.task_length * self.spot_cost,
-                    schedule.carbon_cost,
+                    task.CPUs * task_length * self.spot_cost,
+                    carbon_cost,
+                    task_length=task_length,
+                    task_length_class=task_length_class,
+                    arrival_time=arrival_time,
                 )
             else:
                 if self.available_reserved_instances >= task.CPUs:
@@ -42,20 +49,69 @@ class SimulationCluster(BaseCluster):
                     self.available_reserved_instances -= task.CPUs
                 else:
                     on_demand = task.CPUs
-                self.total_carbon_cost += schedule.carbon_cost
+                self.total_carbon_cost += carbon_cost
                 self.total_dollar_cost += (
-                    on_demand * task.task_length * self.on_demand_cost
+                    on_demand * task_length * self.on_demand_cost
                 )
                 self.log_task(
                     current_time,
                     task,
-                    on_demand * task.task_length * self.on_demand_cost,
-                    schedule.carbon_cost,
+                    on_demand * task_length * self.on_demand_cost,
+                    carbon_cost,
+                    task_length=task_length,
+                    task_length_class=task_length_class,
+                    arrival_time=arrival_time,
                 )
         except:
             print("RealClusterCost: execute error")
             raise
 
+    def submit_batch(self, start_times: np.ndarray, tasks: List[Task]):
+        """Account for tasks with known start times in bulk, equivalent to calling `submit` at each start time.
+        Tasks are dispatched by start time then arrival time, and reserved instances are released
+        for dispatches after their finish time, like `refresh_data` at the end of each tick.
+
+        Args:
+            start_times (np.ndarray): absolute start time index of each task
+            tasks (List[Task]): planned tasks
+        """
+        arrival_times = np.array([task.arrival_time for task in tasks], dtype=int)
+        task_lengths = np.array([task.task_length for task in tasks], dtype=int)
+        CPUs = np.array([task.CPUs for task in tasks], dtype=int)
+        spot = np.array(
+            [self.allow_spot and task.task_length_class == "0-2" for task in tasks], dtype=bool
+        )
+        assert (start_times + task_lengths <= len(self.carbon_model)).all(), "Trace is shorter than task"
+        carbon_costs = (
+            self.carbon_model.window_carbon(start_times, start_times + task_lengths) * CPUs
+        )
+        # lexsort is stable, ties keep the submission order
+        order = np.lexsort((arrival_times, start_times))
+
+        on_demand = np.where(spot, 0, CPUs)
+        if self.total_reserved_instances > 0:
+            release = [(finish_time, cpus) for finish_time, cpus in self.release_instance.items()]
+            heapq.heapify(release)
+            for i in order[~spot[order]]:
+                while len(release) > 0 and release[0][0] < start_times[i]:
+                    self.available_reserved_instances += heapq.heappop(release)[1]
+                if self.available_reserved_instances >= CPUs[i]:
+                    heapq.heappush(release, (start_times[i] + task_lengths[i], CPUs[i]))
+                    self.available_reserved_instances -= CPUs[i]
+                    on_demand[i] = 0
+            self.release_instance = {}
+            for finish_time, cpus in release:
+                self.release_instance[int(finish_time)] = self.release_instance.get(int(finish_time), 0) + int(cpus)
+        dollar_costs = np.where(
+            spot,
+            CPUs * task_lengths * self.spot_cost,
+            on_demand * task_lengths * self.on_demand_cost,
+        )
+        for i in order:
+            self.total_carbon_cost += carbon_costs[i]
+            self.total_dollar_cost += dollar_costs[i]
+            self.log_task(int(start_times[i]), tasks[i], dollar_costs[i], carbon_costs[i])
+
     def refresh_data(self, current_time):
         # release used resource
         self.release_reserved(current_time)
@@ -64,11 +120,20 @@ class SimulationCluster(BaseCluster):
         if current_time in self.release_instance:
             self.available_reserved_instances += self.release_instance[current_time]
             del self.release_instance[current_time]
+            self.last_release = current_time
         assert (
             self.available_reserved_instances <= self.total_reserved_instances
         ), "Available Reserved greater thant Total"
         assert self.available_reserved_instances >= 0, "Greater than zero"
 
+    def next_event_time(self, current_time):
+        if self.last_release == current_time:
+            # released reserved instances can admit waiting tasks in the next tick
+            return current_time + 1
+        if self.release_instance:
+            return min(self.release_instance)
+        return None
+
     def done(self):
         return True
 
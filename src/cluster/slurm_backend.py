@@ -0,0 +1,251 @@
+from calendar import timegm
+from datetime import datetime
+from functools import partial
+from threading import Lock
+import time
+import numpy as np
+
+# slurmdb array ids of jobs that are not part of an array
+NO_VAL = 0xFFFFFFFE
+
+
+def array_task_str(task_ids) -> str:
+    """Slurm array expression of sorted task ids, e.g. "0-3,5"
+
+    Args:
+        task_ids (List[int]): sorted array task ids
+
+    Returns:
+        str: array expression
+    """
+    ranges = []
+    for task_id in task_ids:
+        if ranges and ranges[-1][1] == task_id - 1:
+            ranges[-1][1] = task_id
+        else:
+            ranges.append([task_id, task_id])
+    return ",".join(f"{first}-{last}" if first != last else f"{first}" for first, last in ranges)
+
+
+class SlurmBackend:
+    """Slurm interface used by SlurmCluster: the pyslurm entry points it calls
+    (`JobSubmitDescription(...).submit()`, `node().get()`, `slurmdb_jobs().get(starttime=...)`) and the clock it runs on.
+    """
+
+    def time(self) -> float:
+        """Current time in seconds since the epoch"""
+        return time.time()
+
+    def sleep(self, seconds: float):
+        """Sleep for `seconds` of the backend clock"""
+        time.sleep(seconds)
+
+
+class PySlurmBackend(SlurmBackend):
+    """Real cluster through pyslurm, only importable on the cluster head node"""
+
+    def __init__(self) -> None:
+        import pyslurm
+
+        self.JobSubmitDescription = pyslurm.JobSubmitDescription
+        self.node = pyslurm.node
+        self.slurmdb_jobs = pyslurm.slurmdb_jobs
+
+
+class FakeJobSubmitDescription:
+    """pyslurm.JobSubmitDescription stand-in"""
+
+    def __init__(self, backend, **description) -> None:
+        self.backend = backend
+        self.description = description
+
+    def submit(self) -> int:
+        return self.backend.submit_job(**self.description)
+
+
+class FakeQuery:
+    """pyslurm.node and pyslurm.slurmdb_jobs stand-in, `get` answers from the fake cluster state"""
+
+    def __init__(self, get) -> None:
+        self.get = get
+
+
+class FakeSlurmBackend(SlurmBackend):
+    """In-process cloud Slurm cluster to load test SlurmCluster and SlurmMonitor without a head node.
+    Nodes are powered up on demand and powered down after `idle_timeout`. Jobs complete after `runtime_fraction`
+    of their time limit, unless they fail part way (`failure_rate`) or run into their time limit (`timeout_rate`).
+    The clock runs `time_scale` times faster than wall-clock time, delays are in seconds of that clock.
+
+    Args:
+        time_scale (float): clock speed-up
+        submit_latency (float): duration of a submission RPC
+        power_up_delay (float): time to power up a cloud node
+        idle_timeout (float): idle time before a node is powered down
+        runtime_fraction (float): runtime of completed jobs, as a fraction of their time limit
+        failure_rate (float): probability that a job fails after a uniform share of its runtime
+        timeout_rate (float): probability that a job is killed at its time limit
+        background_rate (float): probability that a submission is followed by a single node job of another user
+            in the same partition, outside any array
+        seed (int): random seed of the job outcomes
+    """
+
+    def __init__(self, time_scale: float = 1.0, submit_latency: float = 0.05, power_up_delay: float = 120.0,
+                 idle_timeout: float = 600.0, runtime_fraction: float = 1.0, failure_rate: float = 0.0,
+                 timeout_rate: float = 0.0, background_rate: float = 0.05, seed: int = 0) -> None:
+        self.time_scale = time_scale
+        self.submit_latency = submit_latency
+        self.power_up_delay = power_up_delay
+        self.idle_timeout = idle_timeout
+        self.runtime_fraction = runtime_fraction
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.background_rate = background_rate
+        self.rng = np.random.default_rng(seed)
+        self.real_start = time.time()
+        self.lock = Lock()
+        self.jobs = {}
+        self.nodes = {}
+        self.JobSubmitDescription = partial(FakeJobSubmitDescription, self)
+        self.node = partial(FakeQuery, self.get_nodes)
+        self.slurmdb_jobs = partial(FakeQuery, self.get_jobs)
+
+    def time(self) -> float:
+        return self.real_start + (time.time() - self.real_start) * self.time_scale
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds / self.time_scale)
+
+    def submit_job(self, name, nodes, partitions, time_limit, array=None, **description) -> int:
+        """Submit a job, or a job array of identical tasks in a single request (`array="0-N"`)
+
+        Returns:
+            int: job id, the id of the first task for arrays
+        """
+        self.sleep(self.submit_latency)
+        with self.lock:
+            now = self.time()
+            if array is None:
+                job_id = self.start_job(now, name, nodes, partitions[0], time_limit, description, 0, NO_VAL)
+            else:
+                first, last = map(int, array.split("-"))
+                job_id = len(self.jobs) + 1
+                for array_task_id in range(first, last + 1):
+                    self.start_job(now, name, nodes, partitions[0], time_limit, description, job_id, array_task_id)
+            if self.rng.random() < self.background_rate:
+                self.start_job(now, "background", 1, partitions[0], time_limit, {}, 0, NO_VAL)
+            return job_id
+
+    def start_job(self, now, name, nodes, partition, time_limit, description, array_job_id, array_task_id) -> int:
+        """Allocate nodes for a job, idle powered nodes first, and draw its runtime and final state
+
+        Returns:
+            int: job id
+        """
+        allocated = [
+            node for node in self.nodes.values() if node["partition"] == partition and node["busy_until"] <= now
+        ][:nodes]
+        for _ in range(nodes - len(allocated)):
+            node = {"partition": partition, "busy_until": float("-inf")}
+            self.nodes[f"{partition}-dy-{len(self.nodes) + 1}"] = node
+            allocated.append(node)
+        for node in allocated:
+            powered_down = node["busy_until"] + self.idle_timeout <= now
+            node["powered_at"] = now + self.power_up_delay if powered_down else now
+        start = max(node["powered_at"] for node in allocated)
+        outcome = self.rng.random()
+        if outcome < self.failure_rate:
+            state, exitcode = "FAILED", 1
+            end = start + self.rng.random() * self.runtime_fraction * time_limit * 60
+        elif outcome < self.failure_rate + self.timeout_rate:
+            state, exitcode = "TIMEOUT", 0
+            end = start + time_limit * 60
+        else:
+            state, exitcode = "COMPLETED", 0
+            end = start + self.runtime_fraction * time_limit * 60
+        for node in allocated:
+            node["busy_until"] = end
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = {
+            "jobname": name,
+            "array_job_id": array_job_id,
+            "array_task_id": array_task_id,
+            "submit": now,
+            "start": start,
+            "end": end,
+            "final_state": state,
+            "final_exitcode": exitcode,
+            "req_cpus": description.get("ntasks", nodes),
+            "nodes": nodes,
+            "partition": partition,
+        }
+        return job_id
+
+    def get_nodes(self) -> dict:
+        """Node states at the current time, like `pyslurm.node().get()`"""
+        with self.lock:
+            now = self.time()
+            nodes = {}
+            for name, node in self.nodes.items():
+                if now < node["powered_at"]:
+                    state = "ALLOCATED+CLOUD+POWER"
+                elif now < node["busy_until"]:
+                    state = "ALLOCATED+CLOUD"
+                elif now < node["busy_until"] + self.idle_timeout:
+                    state = "IDLE+CLOUD"
+                else:
+                    state = "IDLE+CLOUD+POWER"
+                nodes[name] = {"name": name, "state": state, "partitions": [node["partition"]]}
+            return nodes
+
+    def get_jobs(self, starttime: bytes = b"1970-01-01T00:00:00") -> dict:
+        """Accounting records of the jobs not finished before `starttime` (UTC), like `pyslurm.slurmdb_jobs().get()`.
+        The tasks of an array that have not started are one record, with `array_task_id` NO_VAL and `array_task_str`.
+        """
+        since = timegm(datetime.strptime(starttime.decode("utf-8"), "%Y-%m-%dT%H:%M:%S").timetuple())
+        with self.lock:
+            now = self.time()
+            jobs = {}
+            pending_arrays = {}
+            for job_id, job in self.jobs.items():
+                started, completed = now >= job["start"], now >= job["end"]
+                if completed and job["end"] < since:
+                    continue
+                record = {key: value for key, value in job.items() if not key.startswith("final_")}
+                record["array_task_str"] = None
+                if not started and job["array_task_id"] != NO_VAL:
+                    if job["array_job_id"] in pending_arrays:
+                        pending_arrays[job["array_job_id"]]["array_task_ids"].append(job["array_task_id"])
+                        continue
+                    record["array_task_ids"] = [job["array_task_id"]]
+                    pending_arrays[job["array_job_id"]] = record
+                jobs[job_id] = {
+                    **record,
+                    "start": job["start"] if started else 0,
+                    "end": job["end"] if completed else 0,
+                    "elapsed": round(min(now, job["end"]) - job["start"]) if started else 0,
+                    "state_str": job["final_state"] if completed else "RUNNING" if started else "PENDING",
+                    "exitcode": job["final_exitcode"] if completed else 0,
+                }
+            for job_id, job in jobs.items():
+                if "array_task_ids" in job:
+                    job["array_task_str"] = array_task_str(job.pop("array_task_ids"))
+                    job["array_task_id"] = NO_VAL
+            return jobs
+
+
+def create_slurm_backend(slurm_backend: str, fake_options: dict = None) -> SlurmBackend:
+    """Create the Slurm backend of a SlurmCluster
+
+    Args:
+        slurm_backend (str): "pyslurm" or "fake"
+        fake_options (dict): keyword arguments of FakeSlurmBackend (clock speed-up, delays and job outcomes)
+
+    Returns:
+        SlurmBackend: backend
+    """
+    if slurm_backend == "pyslurm":
+        return PySlurmBackend()
+    elif slurm_backend == "fake":
+        return FakeSlurmBackend(**(fake_options or {}))
+    else:
+        raise Exception("Unknown Slurm Backend")
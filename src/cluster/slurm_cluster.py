@@ -1,14 +1,15 @@
 from collections.abc import Callable, Iterable, Mapping
+from queue import Queue
 import sys
-from threading import Thread
+from threading import Lock, Thread
 from typing import Any, List
 from carbon import CarbonModel
 from .base_cluster import BaseCluster
+from .slurm_backend import SlurmBackend, PySlurmBackend, NO_VAL
+from .job_profiles import JobProfiles
 from task import Task
 import pandas as pd
 import os
-import time
-import pyslurm
 from scheduling.carbon_waiting_policy import compute_carbon_consumption
 from collections import namedtuple
 from datetime import datetime
@@ -30,42 +31,61 @@ KNOWN_STATES = [
     "ALLOCATED#+CLOUD",
     "ALLOCATED+CLOUD+POWER",
 ]
+FINAL_STATES = ["COMPLETED", "TIMEOUT", "FAILED"]
+# default MaxArraySize of slurm.conf allows array task ids up to 1000
+MAX_ARRAY_SIZE = 1000
 
 
-def get_final_tasks(cluster_partition, start_ts) -> List[TResult]:
-    tresults = []
-    try:
-        start_time = datetime.utcfromtimestamp(start_ts).strftime("%Y-%m-%dT00:00:00")
-        jobs = pyslurm.slurmdb_jobs()
-        jobs_dict = jobs.get(
-            starttime=start_time.encode("utf-8"),
+def array_task_ids(array_task_str: str) -> List[int]:
+    """Task ids of a slurm array expression, e.g. "0-3,5" or "0-9:2%4"
+
+    Args:
+        array_task_str (str): array expression, with optional steps and throttle
+
+    Returns:
+        List[int]: array task ids
+    """
+    task_ids = []
+    for part in array_task_str.split("%")[0].split(","):
+        bounds, _, step = part.partition(":")
+        first, _, last = bounds.partition("-")
+        task_ids += range(int(first), int(last or first) + 1, int(step or 1))
+    return task_ids
+
+
+def job_results(job_detail: dict, start_ts: float) -> List[TResult]:
+    """Accounting records of the array tasks of a slurmdb record, times relative to the experiment start.
+    Tasks that have not started yet are reported together, with `array_task_id` NO_VAL and their ids in `array_task_str`.
+    Jobs that are not part of an array also have `array_task_id` NO_VAL, but no `array_task_str`.
+
+    Args:
+        job_detail (dict): slurmdb record
+        start_ts (float): experiment start timestamp
+
+    Returns:
+        List[TResult]: one job result per array task, or the job result of a job outside arrays
+    """
+    if job_detail["array_task_id"] != NO_VAL:
+        jobnames = [f"{job_detail['jobname']}_{job_detail['array_task_id']}"]
+    elif job_detail.get("array_task_str"):
+        jobnames = [f"{job_detail['jobname']}_{task_id}" for task_id in array_task_ids(job_detail["array_task_str"])]
+    else:
+        jobnames = [job_detail["jobname"]]
+    return [
+        TResult(
+            jobname=jobname,
+            submit=round(job_detail["submit"] - start_ts),
+            start=round(job_detail["start"] - start_ts),
+            end=round(job_detail["end"] - start_ts),
+            elapsed=job_detail["elapsed"],
+            req_cpus=job_detail["req_cpus"],
+            state_str=job_detail["state_str"],
+            exitcode=job_detail["exitcode"],
+            nodes=job_detail["nodes"],
+            partition=job_detail["partition"],
         )
-        if jobs_dict:
-            for job_id, job_detail in jobs_dict.items():
-                tresult = TResult(
-                    jobname=job_detail["jobname"],
-                    submit=round(job_detail["submit"] - start_ts),
-                    start=round(job_detail["start"] - start_ts),
-                    end=round(job_detail["end"] - start_ts),
-                    elapsed=job_detail["elapsed"],
-                    req_cpus=job_detail["req_cpus"],
-                    state_str=job_detail["state_str"],
-                    exitcode=job_detail["exitcode"],
-                    nodes=job_detail["nodes"],
-                    partition=job_detail["partition"],
-                )
-                if cluster_partition not in job_detail["partition"]:
-                    continue
-                if tresult.submit < -1:
-                    continue
-                # assert tresult.state_str == "COMPLETED" or tresult.state_str == "TIMEOUT"
-                tresults.append(tresult)
-            return tresults
-        else:
-            return None
-    except Exception as execption:
-        print(f"Error:{execption.args[0]}")
-        return None
+        for jobname in jobnames
+    ]
 
 
 class SlurmCluster(BaseCluster):
@@ -76,6 +96,9 @@ class SlurmCluster(BaseCluster):
         experiment_name: str,
         cluster_partition: str,
         allow_spot,
+        backend: SlurmBackend = None,
+        job_profile: str = "nbody100k",
+        time_limit_percentile: int = None,
     ) -> None:
         super().__init__(
             reserved_instances=reserved_instances,
@@ -83,19 +106,37 @@ class SlurmCluster(BaseCluster):
             experiment_name=experiment_name,
             allow_spot=allow_spot,
         )
-        self.experiment_start = time.time()
-        self.last_sleep = time.time()
+        self.backend = backend or PySlurmBackend()
+        self.experiment_start = self.backend.time()
+        self.last_sleep = self.backend.time()
         self.cluster_partition = cluster_partition
+        self.job_profiles = JobProfiles()
+        # profile of the submitted job, iterations come from its mean time and the time limit from the percentile
+        self.job_profile = job_profile
+        self.time_limit_percentile = time_limit_percentile
+        # tasks by array task name (`<array name>_<index>`)
         self.task_dict = {}
+        # tasks and their iterations dispatched in the current tick, by partition, nodes and time limit
+        self.pending_submissions = {}
+        self.submitted_arrays = 0
+        self.array_names = set()
         self.running_jobs = -1
+        self.slurmSubmitter: SlurmSubmitter = SlurmSubmitter(self)
+        self.slurmSubmitter.start()
         self.slurmMonitor: SlurmMonitor = SlurmMonitor(self)
         self.slurmMonitor.start()
 
-    def submit(self, current_time, task: Task):
+    def submit(self, current_time, task: Task, task_length=None, task_length_class=None, arrival_time=None):
         try:
-            df = pd.read_csv("jobs/profiles/nbody100k.csv")
-            iter_time = df[df["nodes"] == task.CPUs]["iteration_time"].mean()
+            if task_length is not None:
+                # slurm jobs are tracked by their Task, each interval gets its own
+                interval = Task(task.ID, arrival_time, task_length, task.CPUs)
+                interval.task_length_class = task_length_class
+                task = interval
+            iter_time = self.job_profiles.iteration_time(self.job_profile, task.CPUs)
             iters = round(task.task_length / iter_time)
+            if self.time_limit_percentile is not None:
+                iter_time = self.job_profiles.percentile(self.job_profile, task.CPUs, self.time_limit_percentile)
             minutes = round(iters * iter_time / 60)
             print(f"Expected time is:{minutes} minutes")
             c_model = self.carbon_model.subtrace(
@@ -136,26 +177,46 @@ class SlurmCluster(BaseCluster):
                     schedule.carbon_cost,
                 )
 
-            name = f"{task.ID}-{self.experiment_name}"
-            self.task_dict[name] = task
-            print(f"Submiting {name} for {task.CPUs} CPUs and {reserved} reserved")
-            desc = pyslurm.JobSubmitDescription(
-                name=name,
-                nodes=task.CPUs,
-                ntasks=task.CPUs,
-                script="/home/ubuntu/ParallelCluster/src/cluster_traces/nbody.sh",
-                script_args=f"100000 {iters} results-{name}/",
-                partitions=partitions,
-                time_limit=minutes,
-            )
-            job_id = desc.submit()
+            print(f"Queueing {task.ID}-{self.experiment_name} for {task.CPUs} CPUs and {reserved} reserved")
+            self.pending_submissions.setdefault((partitions[0], task.CPUs, minutes), []).append((task, iters))
 
         except ValueError as value_error:
             print(f"Job query failed - {value_error.args[0]}")
             sys.exit(1)
 
     def refresh_data(self, current_time):
-        return
+        """Hand the tasks dispatched in this tick to the submission worker, one job array per partition, nodes and
+        time limit. A burst of arrivals costs one slurmctld request per group instead of one per task,
+        and the scheduler tick never waits for slurmctld unless the submission queue is full.
+        The iterations of each array task are passed as a list that nbody.sh indexes with SLURM_ARRAY_TASK_ID.
+
+        Args:
+            current_time (index): time index
+        """
+        self.exit_if_submission_failed()
+        for (partition, nodes, minutes), group in self.pending_submissions.items():
+            for begin in range(0, len(group), MAX_ARRAY_SIZE):
+                tasks = group[begin:begin + MAX_ARRAY_SIZE]
+                name = f"{self.submitted_arrays}-{self.experiment_name}"
+                self.submitted_arrays += 1
+                self.array_names.add(name)
+                for index, (task, _) in enumerate(tasks):
+                    self.task_dict[f"{name}_{index}"] = task
+                print(f"Submiting {name} array of {len(tasks)} jobs for {nodes} CPUs")
+                self.slurmSubmitter.put(
+                    dict(
+                        name=name,
+                        nodes=nodes,
+                        ntasks=nodes,
+                        script="/home/ubuntu/ParallelCluster/src/cluster_traces/nbody.sh",
+                        script_args=f"100000 results-{name} " + " ".join(str(iters) for _, iters in tasks),
+                        partitions=[partition],
+                        time_limit=minutes,
+                        array=f"0-{len(tasks) - 1}",
+                    ),
+                    sum(task.reserved for task, _ in tasks),
+                )
+        self.pending_submissions = {}
 
     def collect_slurm_results(
         self,
@@ -167,24 +228,23 @@ class SlurmCluster(BaseCluster):
         waiting_times_str,
     ):
         self.slurmMonitor.started = False
-        tresults = get_final_tasks(self.cluster_partition, self.experiment_start)
+        self.slurmSubmitter.stop()
+        self.exit_if_submission_failed()
+        with self.lock:
+            tresults = self.slurmMonitor.final_tasks()
         real_details = []
         for tresult in tresults:
             task = self.task_dict[tresult.jobname]
             waiting_time = max(tresult.submit - task.arrival_time, 0)
             self.max_time = max(self.max_time, tresult.start)
 
-            execution_carbon = self.carbon_model.df["carbon_intensity_avg"][
-                tresult.start : tresult.end
-            ]
             run_carbon = (
-                execution_carbon.sum() * tresult.req_cpus
+                self.carbon_model.window_carbon(tresult.start, tresult.end)
+                * tresult.req_cpus
             )  # 1 watt per core for now
-            execution_carbon = self.carbon_model.df["carbon_intensity_avg"][
-                tresult.submit : tresult.end
-            ]
             total_carbon = (
-                execution_carbon.sum() * tresult.req_cpus
+                self.carbon_model.window_carbon(tresult.submit, tresult.end)
+                * tresult.req_cpus
             )  # 1 watt per core for now
 
             if "spot" in tresult.partition:
@@ -207,7 +267,7 @@ class SlurmCluster(BaseCluster):
 
             real_details.append(
                 [
-                    tresult.jobname,
+                    f"{task.ID}-{self.experiment_name}",
                     task.arrival_time,
                     task.task_length,
                     tresult.req_cpus,
@@ -278,6 +338,18 @@ class SlurmCluster(BaseCluster):
         )
         file_name = f"results/slurm/{task_trace}/slurm-runtime-{scheduling_policy}-{self.carbon_model.carbon_start_index}-{carbon_policy}-{carbon_trace}-{self.total_reserved_instances}-{waiting_times_str}.csv"
         df.to_csv(file_name, index=False)
+        df = pd.DataFrame(
+            self.slurmSubmitter.details,
+            columns=[
+                "time",
+                "jobs",
+                "latency",
+                "queue_depth",
+                "backlog",
+            ],
+        )
+        file_name = f"results/slurm/{task_trace}/slurm-submissions-{scheduling_policy}-{self.carbon_model.carbon_start_index}-{carbon_policy}-{carbon_trace}-{self.total_reserved_instances}-{waiting_times_str}.csv"
+        df.to_csv(file_name, index=False)
 
     def save_results(
         self,
@@ -306,12 +378,21 @@ class SlurmCluster(BaseCluster):
         )
 
     def sleep(self):
-        actual_sleep = max(1 - (time.time() - self.last_sleep), 0)
-        time.sleep(actual_sleep)
-        self.last_sleep = time.time()
+        actual_sleep = max(1 - (self.backend.time() - self.last_sleep), 0)
+        self.backend.sleep(actual_sleep)
+        self.last_sleep = self.backend.time()
+
+    def exit_if_submission_failed(self):
+        """Stop the experiment with an error once a job array could not be submitted, its tasks would be missing"""
+        if self.slurmSubmitter.failed:
+            self.slurmMonitor.started = False
+            sys.exit(1)
 
     def done(self):
-        return self.running_jobs == 0
+        self.exit_if_submission_failed()
+        # the monitor updates running_jobs and confirms submitted arrays under the lock
+        with self.lock:
+            return self.running_jobs == 0 and self.slurmSubmitter.pending() == 0
 
 
 class SlurmMonitor(Thread):
@@ -324,12 +405,17 @@ class SlurmMonitor(Thread):
         self.current_time = 0
         self.total_carbon_cost = 0
         self.total_dollar_cost = 0
-        self.last_sleep = time.time()
+        self.last_sleep = cluster.backend.time()
+        # slurmdb is only queried for the jobs active since the watermark
+        self.watermark = cluster.experiment_start
+        # latest result of every array task of the experiment, and the reserved instances of the unfinished ones
+        self.jobs = {}
+        self.active_jobs = {}
 
     def node_stats(self) -> (int, int, int):
         power_on, power_on_spot = 0, 0
         try:
-            nodes = pyslurm.node()
+            nodes = self.cluster.backend.node()
             new_node_dict = nodes.get()
             if new_node_dict:
                 for k, node_details in new_node_dict.items():
@@ -349,48 +435,65 @@ class SlurmMonitor(Thread):
             print(f"Error - {e.args[0]}")
         return power_on, power_on_spot
 
-    def running_jobs(self) -> int:
-        running = 0
-        reserved = self.cluster.total_reserved_instances
+    def poll_jobs(self):
+        """Update the job table with the jobs active since the previous poll.
+        Jobs that finished before it are already final in the table, so a poll costs the active jobs, not the history.
+        """
+        poll_start = self.cluster.backend.time()
         try:
-            start_time = datetime.utcfromtimestamp(
-                self.cluster.experiment_start
-            ).strftime("%Y-%m-%dT00:00:00")
-            jobs = pyslurm.slurmdb_jobs()
+            start_time = datetime.utcfromtimestamp(self.watermark).strftime("%Y-%m-%dT%H:%M:%S")
+            jobs = self.cluster.backend.slurmdb_jobs()
             jobs_dict = jobs.get(
                 starttime=start_time.encode("utf-8"),
             )
-            if jobs_dict:
-                for _, job_detail in jobs_dict.items():
-                    if self.cluster.cluster_partition not in job_detail["partition"]:
-                        continue
-                    submit = int(job_detail["submit"] - self.cluster.experiment_start)
-                    if submit < -1:
-                        continue
-                    if job_detail["state_str"] not in [
-                        "COMPLETED",
-                        "TIMEOUT",
-                        "FAILED",
-                    ]:
-                        running += 1
-                        reserved -= self.cluster.task_dict[
-                            job_detail["jobname"]
-                        ].reserved
-                return running, reserved
-            else:
-                return 0
         except Exception as execption:
             print(f"Error:{execption.args[0]}")
-            return 0
+            return
+        for job_detail in (jobs_dict or {}).values():
+            # other users and experiments may share the partition
+            if (
+                self.cluster.cluster_partition not in job_detail["partition"]
+                or job_detail["jobname"] not in self.cluster.array_names
+            ):
+                continue
+            self.cluster.slurmSubmitter.confirm(job_detail["jobname"])
+            for tresult in job_results(job_detail, self.cluster.experiment_start):
+                if tresult.submit < -1 or tresult.jobname not in self.cluster.task_dict:
+                    continue
+                self.jobs[tresult.jobname] = tresult
+                if tresult.state_str in FINAL_STATES:
+                    self.active_jobs.pop(tresult.jobname, None)
+                else:
+                    self.active_jobs[tresult.jobname] = self.cluster.task_dict[tresult.jobname].reserved
+        # accounting times have a one second resolution
+        self.watermark = poll_start - 1
+
+    def running_jobs(self) -> (int, int):
+        self.poll_jobs()
+        reserved = (
+            self.cluster.total_reserved_instances
+            - sum(self.active_jobs.values())
+            - self.cluster.slurmSubmitter.reserved()
+        )
+        return len(self.active_jobs), reserved
+
+    def final_tasks(self) -> List[TResult]:
+        """Results of all the jobs of the experiment, after a last poll
+
+        Returns:
+            List[TResult]: job results
+        """
+        self.poll_jobs()
+        return list(self.jobs.values())
 
     def collect_info(self):
         power_on, power_on_spot = self.node_stats()
         running_jobs, reserved_idle = self.running_jobs()
         if reserved_idle < 0:
             print(f"How Come? {reserved_idle}")
-        execution_carbon = self.cluster.carbon_model.df["carbon_intensity_avg"][
-            self.current_time : self.current_time + self.sleep_time
-        ].sum()
+        execution_carbon = self.cluster.carbon_model.window_carbon(
+            self.current_time, self.current_time + self.sleep_time
+        )
 
         self.total_carbon_cost += (power_on + power_on_spot) * execution_carbon
         self.total_dollar_cost += (
@@ -414,7 +517,7 @@ class SlurmMonitor(Thread):
                 running_jobs,
             ]
         )
-        self.last_sleep = time.time()
+        self.last_sleep = self.cluster.backend.time()
 
     def run(self) -> None:
         self.started = True
@@ -422,5 +525,78 @@ class SlurmMonitor(Thread):
             with self.cluster.lock:
                 self.collect_info()
             self.current_time += self.sleep_time
-            actual_sleep = max(self.sleep_time - (time.time() - self.last_sleep), 0)
-            time.sleep(actual_sleep)
+            actual_sleep = max(self.sleep_time - (self.cluster.backend.time() - self.last_sleep), 0)
+            self.cluster.backend.sleep(actual_sleep)
+
+
+class SlurmSubmitter(Thread):
+    """Submits the job arrays queued by the cluster, so slurmctld latency never stalls the scheduler tick.
+    Each submission records its time, size, request latency, queue depth and backlog (seconds from enqueue to submitted).
+    The reserved instances of an array stay held here until slurmdb reports the array to the monitor.
+
+    Args:
+        cluster (SlurmCluster): cluster
+        max_queued (int): queued job arrays before `put` blocks the scheduler
+    """
+
+    def __init__(self, cluster: SlurmCluster, max_queued=256):
+        Thread.__init__(self, daemon=True)
+        self.cluster = cluster
+        self.queue = Queue(maxsize=max_queued)
+        self.details = []
+        self.failed = False
+        self.lock = Lock()
+        # reserved instances of the arrays queued, being submitted, or submitted but not yet seen in slurmdb
+        self.unconfirmed = {}
+
+    def put(self, description: dict, reserved: int):
+        with self.lock:
+            self.unconfirmed[description["name"]] = reserved
+        self.queue.put((self.cluster.backend.time(), description))
+
+    def confirm(self, name: str):
+        """The array `name` was reported by slurmdb, its tasks are tracked by the monitor from now on"""
+        with self.lock:
+            self.unconfirmed.pop(name, None)
+
+    def pending(self) -> int:
+        """Job arrays not seen in slurmdb yet"""
+        with self.lock:
+            return len(self.unconfirmed)
+
+    def reserved(self) -> int:
+        """Reserved instances held by the job arrays not seen in slurmdb yet"""
+        with self.lock:
+            return sum(self.unconfirmed.values())
+
+    def stop(self):
+        """Stop after the queued submissions"""
+        self.queue.put(None)
+        self.join()
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            enqueued, description = item
+            submit_start = self.cluster.backend.time()
+            try:
+                self.cluster.backend.JobSubmitDescription(**description).submit()
+            except Exception as execption:
+                print(f"Job query failed - {execption}")
+                self.failed = True
+                self.confirm(description["name"])
+            finally:
+                self.queue.task_done()
+            now = self.cluster.backend.time()
+            self.details.append(
+                [
+                    round(now - self.cluster.experiment_start),
+                    int(description["array"].split("-")[1]) + 1,
+                    now - submit_start,
+                    self.queue.qsize(),
+                    now - enqueued,
+                ]
+            )
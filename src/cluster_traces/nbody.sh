@@ -1,2 +1,6 @@
 #!/bin/sh
-mpirun /home/ubuntu/ParallelCluster/jobs/nbody/elastic_nbody -r -b $1 -i $2 -f $3
\ No newline at end of file
+# usage: nbody.sh <bodies> <results prefix> <iterations of array task 0> <iterations of array task 1> ...
+bodies=$1
+results=$2
+shift $((SLURM_ARRAY_TASK_ID + 2))
+mpirun /home/ubuntu/ParallelCluster/jobs/nbody/elastic_nbody -r -b $bodies -i $1 -f ${results}_${SLURM_ARRAY_TASK_ID}/
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import argparse
+import numpy as np
+import pandas as pd
+
+# shortest job accepted by load_tasks, in seconds
+MIN_LENGTH = 300
+
+
+def load_profile(trace_name: str) -> pd.DataFrame:
+    """Empirical job profile of a trace in hours: inter-arrival gap, length and CPUs of each job
+
+    Args:
+        trace_name (str): source trace name in `src/cluster_traces` (hours based, e.g. pai-100k)
+
+    Returns:
+        DataFrame: one row per job, sampled jointly to keep bursts and length/CPUs correlations
+    """
+    df = pd.read_csv(f"src/cluster_traces/{trace_name}.csv").sort_values("arrival_time")
+    gaps = np.diff(df["arrival_time"].to_numpy(), prepend=df["arrival_time"].iloc[0])
+    return pd.DataFrame({"gap": gaps, "length": df["length"].to_numpy(), "cpus": df["cpus"].to_numpy()})
+
+
+def generate_trace(source: str, jobs: int, duration: float, output: str, unit: str = "seconds",
+                   chunk_size: int = 1000000, seed: int = 0):
+    """Stream a synthetic task trace to disk by resampling the jobs of a source trace.
+    Inter-arrival gaps are rescaled so that `jobs` arrivals span about `duration` hours.
+
+    Args:
+        source (str): source trace name
+        jobs (int): number of jobs
+        duration (float): arrival period in hours
+        output (str): csv file, same `arrival_time,length,cpus` schema as the shipped traces
+        unit (str): "seconds" (read by load_tasks, like pai_1k) or "hours" (like the 100k traces)
+        chunk_size (int): jobs generated and written at once
+        seed (int): random seed
+    """
+    profile = load_profile(source)
+    rng = np.random.default_rng(seed)
+    gap_scale = duration / jobs / max(profile["gap"].mean(), np.finfo(float).tiny)
+    unit_scale = 3600 if unit == "seconds" else 1
+    last_arrival = 0.0
+    with open(output, "w") as f:
+        f.write("arrival_time,length,cpus\n")
+        for begin in range(0, jobs, chunk_size):
+            rows = rng.integers(0, len(profile), min(chunk_size, jobs - begin))
+            gaps = profile["gap"].to_numpy()[rows] * gap_scale
+            if begin == 0:
+                gaps[0] = 0
+            arrivals = last_arrival + np.cumsum(gaps)
+            last_arrival = arrivals[-1]
+            chunk = pd.DataFrame({
+                "arrival_time": arrivals * unit_scale,
+                "length": np.maximum(profile["length"].to_numpy()[rows], MIN_LENGTH / 3600) * unit_scale,
+                "cpus": profile["cpus"].to_numpy()[rows],
+            })
+            if unit == "seconds":
+                chunk["arrival_time"] = chunk["arrival_time"].round()
+                chunk["length"] = chunk["length"].round()
+            chunk.to_csv(f, header=False, index=False)
+            print(f"Generated {begin + len(rows)}/{jobs} jobs")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="GAIA: synthetic task trace generator"
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        default="pai-100k",
+        choices=["pai-100k", "azure-100k", "mustang-trace-2015-100k"],
+        dest="source",
+        help="Trace whose arrival, length and CPUs distributions are resampled",
+    )
+    parser.add_argument("-n", "--jobs", type=int, default=1000000, dest="jobs", help="Number of jobs")
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=168,
+        dest="duration",
+        help="Arrival period in hours (the simulated carbon trace covers 720 hours)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        dest="output",
+        help="Output csv, defaults to src/cluster_traces/<source>-<jobs>.csv",
+    )
+    parser.add_argument(
+        "--unit",
+        default="seconds",
+        choices=["seconds", "hours"],
+        dest="unit",
+        help="Time unit of the output, load_tasks reads seconds",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000000, dest="chunk_size", help="Jobs written at once")
+    parser.add_argument("--seed", type=int, default=0, dest="seed", help="Random seed")
+
+    args = parser.parse_args()
+    output = args.output or f"src/cluster_traces/{args.source}-{args.jobs}.csv"
+    generate_trace(args.source, args.jobs, args.duration, output, args.unit, args.chunk_size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from functools import lru_cache
+import glob
+import hashlib
+import json
+import os
+
+CACHE_DIR = "results/.cache"
+
+
+def file_fingerprint(file_name: str) -> str:
+    """Cheap fingerprint of an input file, changes when the file is rewritten
+
+    Args:
+        file_name (str): file path
+
+    Returns:
+        str: size and modification time
+    """
+    stat = os.stat(file_name)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    """Hash of the simulator sources, results of older code are never reused
+
+    Returns:
+        str: sha256 of every python file under src
+    """
+    digest = hashlib.sha256()
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for file_name in sorted(glob.glob(f"{source_dir}/**/*.py", recursive=True)):
+        digest.update(os.path.relpath(file_name, source_dir).encode())
+        with open(file_name, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def result_key(experiment_name: str, cluster_type: str, search_granularity: float, carbon_trace: str, task_trace: str) -> str:
+    """Content address of an experiment result
+
+    Args:
+        experiment_name (str): hashed configuration of the experiment
+        cluster_type (str): cluster Type
+        search_granularity (float): seconds between candidate start times of the carbon policies
+        carbon_trace (str): carbon trace name
+        task_trace (str): task trace name
+
+    Returns:
+        str: cache key
+    """
+    key = [
+        experiment_name,
+        cluster_type,
+        str(search_granularity),
+        file_fingerprint(f"src/traces/{carbon_trace}.csv"),
+        file_fingerprint(f"src/cluster_traces/{task_trace}.csv"),
+        code_version(),
+    ]
+    return hashlib.sha256("|".join(key).encode()).hexdigest()[:20]
+
+
+def file_digest(file_name: str) -> str:
+    """sha256 of a result file"""
+    with open(file_name, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def lookup(key: str, file_name: str) -> bool:
+    """Whether the result file of an experiment was completed with the same configuration, traces and code
+
+    Args:
+        key (str): `result_key` of the experiment
+        file_name (str): result file of the experiment
+
+    Returns:
+        bool: True if the experiment can be skipped
+    """
+    try:
+        with open(f"{CACHE_DIR}/{key}.json") as f:
+            manifest = json.load(f)
+        return manifest["file_name"] == file_name and manifest["sha256"] == file_digest(file_name)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def record(key: str, file_name: str, configuration: dict):
+    """Record a completed experiment, the result file is written last so a crashed run is never recorded
+
+    Args:
+        key (str): `result_key` of the experiment
+        file_name (str): result file of the experiment
+        configuration (dict): experiment description kept in the manifest
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    manifest = {"file_name": file_name, "sha256": file_digest(file_name), "configuration": configuration}
+    with open(f"{CACHE_DIR}/{key}.json.{os.getpid()}", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{CACHE_DIR}/{key}.json.{os.getpid()}", f"{CACHE_DIR}/{key}.json")
@@ -1,26 +1,71 @@
 #!/usr/bin/env python3
 import argparse
-from typing import List
 import pandas as pd
 from carbon import get_carbon_model, CarbonModel
-from task import Task, set_waiting_times, load_tasks, TIME_FACTOR
-from scheduling import create_scheduler
+from task import ArrivalStream, TaskTable, set_waiting_times, load_tasks, TIME_FACTOR
+from scheduling import create_scheduler, set_search_granularity
 from cluster import create_cluster
 import hashlib
-import time
+import math
+import result_cache
+
+
+def next_event_time(i: int, arrivals: ArrivalStream, scheduler, cluster) -> int:
+    """Next time index where anything can happen (task arrival, queued job start or resource release).
+    Idle ticks in between are skipped, tick-based clusters (slurm) always return the next tick.
+
+    Args:
+        i (int): current loop index
+        arrivals (ArrivalStream): tasks that did not arrive yet
+        scheduler (SchedulingPolicy): scheduling policy
+        cluster (BaseCluster): cluster
+
+    Returns:
+        int: next loop index
+    """
+    events = [cluster.next_event_time(i), scheduler.next_event_time(), arrivals.next_arrival_time()]
+    events = [event for event in events if event is not None]
+    if len(events) == 0:
+        return math.inf
+    return max(i + 1, min(events))
+
+
+def get_experiment_name(
+    carbon_trace: str,
+    carbon_start_index: int,
+    scheduling_policy: str,
+    carbon_policy: str,
+    waiting_times_str: str,
+    reserved_instances: int,
+    task_trace: str,
+    cluster_partition: str,
+) -> str:
+    """Hashed configuration, used to track slurm tasks and to key cached results
+
+    Returns:
+        str: experiment name
+    """
+    return hashlib.md5(
+        f"{carbon_trace}-{carbon_start_index}-{scheduling_policy}-{carbon_policy}-{waiting_times_str}-{reserved_instances}-{task_trace}-{cluster_partition}".encode()
+    ).hexdigest()[:10]
 
 
 def run_experiment(
     cluster_type: str,
     carbon_start_index: int,
     carbon_model: CarbonModel,
-    tasks: List[Task],
+    tasks: TaskTable,
     scheduling_policy: str,
     carbon_policy: str,
     reserved_instances: int,
     task_trace: str,
     waiting_times_str: str,
     cluster_partition: str,
+    batch: bool = False,
+    slurm_backend: str = "pyslurm",
+    fake_options: dict = None,
+    job_profile: str = "nbody100k",
+    time_limit_percentile: int = None,
 ):
     """Run Experiments
 
@@ -28,49 +73,69 @@ def run_experiment(
         cluster_type (str): cluster Type
         carbon_start_index (int): carbon trace start time
         scheduling_policy (str): scheduling algorithm
+        tasks (TaskTable): Task trace, not modified
         carbon_policy (str): carbon waiting policy
         reserved_instances (int): number of reserved instances
         waiting_times_str (str): waiting times per queue
         task_trace (str): Task Trace
         waiting_times_str (str): waiting times per queue
         cluster_partition (str): used cluster partition (queue), only for slurm experiment.
+        batch (bool): plan the whole trace at once, only for capacity-free policies in simulation.
+        slurm_backend (str): Slurm backend ("pyslurm"|"fake"), only for slurm experiment.
+        fake_options (dict): settings of the fake Slurm backend, see FakeSlurmBackend.
+        job_profile (str): profile in `jobs/profiles` of the job submitted for each task, only for slurm experiment.
+        time_limit_percentile (int): iteration time percentile of the slurm job time limits, defaults to the mean.
 
     Returns:
         List: Results
     """
-    experiment_name = hashlib.md5(
-        f"{carbon_model.name}-{carbon_start_index}-{scheduling_policy}-{carbon_policy}-{waiting_times_str}-{reserved_instances}-{task_trace}-{cluster_partition}".encode()
-    ).hexdigest()[:10]
     cluster = create_cluster(
         cluster_type,
         scheduling_policy,
         carbon_model,
         reserved_instances,
-        experiment_name,
+        get_experiment_name(
+            carbon_model.name,
+            carbon_start_index,
+            scheduling_policy,
+            carbon_policy,
+            waiting_times_str,
+            reserved_instances,
+            task_trace,
+            cluster_partition,
+        ),
         waiting_times_str,
         cluster_partition,
+        slurm_backend,
+        fake_options,
+        job_profile,
+        time_limit_percentile,
     )
     scheduler = create_scheduler(
         cluster, scheduling_policy, carbon_policy, carbon_model
     )
-    for i in range(0, carbon_model.df.shape[0]):
-        current_time = i
-        if cluster_type == "slurm":
-            current_time = max(i, round(time.time() - cluster.experiment_start))
-            # if current_time != i:
-            #    print(f"Current time = {current_time} with i = {i}")
-        while len(tasks) > 0:
-            if tasks[0].arrival_time <= current_time:
-                if tasks[0].task_length > 0:
-                    scheduler.submit(current_time, tasks[0])
-                del tasks[0]
-            else:
+    if batch:
+        scheduler.submit_batch(tasks)
+    else:
+        arrivals = ArrivalStream(tasks)
+        i = 0
+        while i < len(carbon_model):
+            current_time = i
+            if cluster_type == "slurm":
+                current_time = max(i, round(cluster.backend.time() - cluster.experiment_start))
+                # if current_time != i:
+                #    print(f"Current time = {current_time} with i = {i}")
+            for task in arrivals.pop_arrived(current_time):
+                if task.task_length > 0:
+                    scheduler.submit(current_time, task)
+            with cluster.lock:
+                scheduler.execute(current_time)
+            cluster.sleep()
+            if arrivals.empty() and scheduler.queue.empty() and cluster.done():
                 break
-        with cluster.lock:
-            scheduler.execute(current_time)
-        cluster.sleep()
-        if len(tasks) == 0 and scheduler.queue.empty() and cluster.done():
-            break
+            i = next_event_time(i, arrivals, scheduler, cluster)
+        if getattr(scheduler, "decisions", None) is not None and scheduler.carbon_aware:
+            print(f"Start time decisions: {scheduler.decisions}")
     cluster.save_results(
         cluster_type,
         scheduling_policy,
@@ -82,6 +147,24 @@ def run_experiment(
     return [cluster.total_carbon_cost, cluster.total_dollar_cost]
 
 
+def result_file_name(
+    cluster_type: str,
+    carbon_start_index: int,
+    carbon_trace: str,
+    task_trace: str,
+    scheduling_policy: str,
+    carbon_policy: str,
+    reserved_instances: int,
+    waiting_times_str: str,
+) -> str:
+    """Path of the total carbon and dollar cost of an experiment
+
+    Returns:
+        str: csv file name
+    """
+    return f"results/{cluster_type}/{task_trace}/{scheduling_policy}-{carbon_start_index}-{carbon_policy}-{carbon_trace}-{reserved_instances}-{waiting_times_str}.csv"
+
+
 def prepare_experiment(
     cluster_type: str,
     carbon_start_index: int,
@@ -92,8 +175,15 @@ def prepare_experiment(
     reserved_instances: int,
     waiting_times_str: str,
     cluster_partition: str,
+    search_granularity: float = 3600,
+    batch: bool = False,
+    force: bool = False,
+    slurm_backend: str = "pyslurm",
+    fake_options: dict = None,
+    job_profile: str = "nbody100k",
+    time_limit_percentile: int = None,
 ):
-    """Prepare and Run Experiment
+    """Prepare and Run Experiment, simulations whose results are cached for the same configuration, traces and code are skipped
 
     Args:
         cluster_type (str): cluster Type
@@ -105,11 +195,48 @@ def prepare_experiment(
         reserved_instances (int): number of reserved instances
         waiting_times_str (str): waiting times per queue
         cluster_partition (str): used cluster partition (queue), only for slurm experiment.
+        search_granularity (float): seconds between candidate start times of the carbon policies
+        batch (bool): plan the whole trace at once, only for capacity-free policies in simulation.
+        force (bool): run even if the results are cached
+        slurm_backend (str): Slurm backend ("pyslurm"|"fake"), only for slurm experiment.
+        fake_options (dict): settings of the fake Slurm backend, see FakeSlurmBackend.
+        job_profile (str): profile in `jobs/profiles` of the job submitted for each task, only for slurm experiment.
+        time_limit_percentile (int): iteration time percentile of the slurm job time limits, defaults to the mean.
     """
+    file_name = result_file_name(
+        cluster_type,
+        carbon_start_index,
+        carbon_trace,
+        task_trace,
+        scheduling_policy,
+        carbon_policy,
+        reserved_instances,
+        waiting_times_str,
+    )
+    key = result_cache.result_key(
+        get_experiment_name(
+            carbon_trace,
+            carbon_start_index,
+            scheduling_policy,
+            carbon_policy,
+            waiting_times_str,
+            reserved_instances,
+            task_trace,
+            cluster_partition,
+        ),
+        cluster_type,
+        search_granularity,
+        carbon_trace,
+        task_trace,
+    )
+    if cluster_type == "simulation" and not force and result_cache.lookup(key, file_name):
+        print(f"Skip Experiments {file_name}, results are cached")
+        return
     print(
         f"Start Experiments {task_trace} - {carbon_trace}-{scheduling_policy}-{carbon_policy}-{waiting_times_str}, and {reserved_instances} reserved"
     )
     set_waiting_times(waiting_times_str)
+    set_search_granularity(search_granularity)
     carbon_model = get_carbon_model(carbon_trace, carbon_start_index)
     tasks = load_tasks(task_trace)
     carbon_model = carbon_model.extend(3600 / TIME_FACTOR)
@@ -125,11 +252,26 @@ def prepare_experiment(
         task_trace,
         waiting_times_str,
         cluster_partition,
+        batch,
+        slurm_backend,
+        fake_options,
+        job_profile,
+        time_limit_percentile,
     )
     results.append(result)
     results = pd.DataFrame(results, columns=["carbon_cost", "dollar_cost"])
-    file_name = f"results/{cluster_type}/{task_trace}/{scheduling_policy}-{carbon_start_index}-{carbon_policy}-{carbon_trace}-{reserved_instances}-{waiting_times_str}.csv"
     results.to_csv(file_name, index=False)
+    if cluster_type == "simulation":
+        result_cache.record(key, file_name, {
+            "carbon_trace": carbon_trace,
+            "carbon_start_index": carbon_start_index,
+            "task_trace": task_trace,
+            "scheduling_policy": scheduling_policy,
+            "carbon_policy": carbon_policy,
+            "reserved_instances": reserved_instances,
+            "waiting_times": waiting_times_str,
+            "search_granularity": search_granularity,
+        })
     print(
         f"Finish Experiments {task_trace} - {carbon_trace}-{scheduling_policy}-{carbon_policy}-{waiting_times_str}, and {reserved_instances} reserved"
     )
@@ -212,8 +354,122 @@ def main():
     parser.add_argument(
         "-p", "--cluster-partition", default="queue1", dest="cluster_partition"
     )
+    parser.add_argument(
+        "-g",
+        "--search-granularity",
+        type=float,
+        default=3600,
+        dest="search_granularity",
+        help=f"Seconds between candidate start times of the carbon policies, a multiple of {TIME_FACTOR}",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        dest="batch",
+        help="Plan the whole task trace at once (simulation with carbon or carbon-spot only)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        dest="force",
+        help="Rerun simulations whose results are cached",
+    )
+    parser.add_argument(
+        "--slurm-backend",
+        default="pyslurm",
+        choices=["pyslurm", "fake"],
+        dest="slurm_backend",
+        help="Slurm interface of the slurm cluster type, fake runs an in-process cloud cluster",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        dest="time_scale",
+        help="Clock speed-up of the fake Slurm backend",
+    )
+    parser.add_argument(
+        "--job-profile",
+        default="nbody100k",
+        dest="job_profile",
+        help="Profile in jobs/profiles of the job submitted for each task (slurm only)",
+    )
+    parser.add_argument(
+        "--time-limit-percentile",
+        type=int,
+        default=None,
+        choices=[50, 90, 99],
+        dest="time_limit_percentile",
+        help="Iteration time percentile of the job time limits, defaults to the mean (slurm only)",
+    )
+    parser.add_argument(
+        "--fake-submit-latency",
+        type=float,
+        default=0.05,
+        dest="submit_latency",
+        help="Seconds per submission request of the fake Slurm backend",
+    )
+    parser.add_argument(
+        "--fake-power-up-delay",
+        type=float,
+        default=120.0,
+        dest="power_up_delay",
+        help="Seconds to power up a node of the fake Slurm backend",
+    )
+    parser.add_argument(
+        "--fake-idle-timeout",
+        type=float,
+        default=600.0,
+        dest="idle_timeout",
+        help="Idle seconds before a node of the fake Slurm backend is powered down",
+    )
+    parser.add_argument(
+        "--fake-runtime-fraction",
+        type=float,
+        default=1.0,
+        dest="runtime_fraction",
+        help="Runtime of completed fake Slurm jobs, as a fraction of their time limit",
+    )
+    parser.add_argument(
+        "--fake-failure-rate",
+        type=float,
+        default=0.0,
+        dest="failure_rate",
+        help="Probability that a fake Slurm job fails",
+    )
+    parser.add_argument(
+        "--fake-timeout-rate",
+        type=float,
+        default=0.0,
+        dest="timeout_rate",
+        help="Probability that a fake Slurm job runs into its time limit",
+    )
+    parser.add_argument(
+        "--fake-background-rate",
+        type=float,
+        default=0.05,
+        dest="background_rate",
+        help="Probability that a fake Slurm submission is followed by a job of another user outside any array",
+    )
 
     args = parser.parse_args()
+    if args.search_granularity <= 0 or args.search_granularity % TIME_FACTOR:
+        parser.error(f"--search-granularity must be a positive multiple of {TIME_FACTOR} seconds")
+    if args.batch and (
+        args.cluster_type != "simulation"
+        or args.scheduling_policy not in ["carbon", "carbon-spot"]
+    ):
+        parser.error("--batch needs --cluster-type simulation and a carbon or carbon-spot scheduling policy")
+    fake_options = dict(
+        time_scale=args.time_scale,
+        submit_latency=args.submit_latency,
+        power_up_delay=args.power_up_delay,
+        idle_timeout=args.idle_timeout,
+        runtime_fraction=args.runtime_fraction,
+        failure_rate=args.failure_rate,
+        timeout_rate=args.timeout_rate,
+        background_rate=args.background_rate,
+    )
     carbon_start_index = []
     if args.start_index == -1:
         carbon_starts = range(0, 8500, 500)
@@ -230,6 +486,13 @@ def main():
             args.reserved_instances,
             args.waiting_times_str,
             args.cluster_partition,
+            args.search_granularity,
+            args.batch,
+            args.force,
+            args.slurm_backend,
+            fake_options,
+            args.job_profile,
+            args.time_limit_percentile,
         )
 
 
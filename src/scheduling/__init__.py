@@ -2,7 +2,7 @@ from carbon import CarbonModel
 from cluster import BaseCluster
 from .scheduling_policy import SchedulingPolicy
 from .suspend_scheduling_policy import SuspendSchedulingPolicy
-from .carbon_waiting_policy import best_waiting_time, lowest_carbon_slot, oracle_carbon_slot,oracle_carbon_slot_waiting,average_carbon_slot_waiting
+from .carbon_waiting_policy import best_waiting_time, lowest_carbon_slot, oracle_carbon_slot,oracle_carbon_slot_waiting,average_carbon_slot_waiting, set_search_granularity
 
 
 def create_scheduler(cluster: BaseCluster, scheduling_policy: str, carbon_policy, carbon_model: CarbonModel) -> SchedulingPolicy:
@@ -1,6 +1,27 @@
+from collections import OrderedDict
+import numpy as np
 from task import Task, TIME_FACTOR
 from carbon import CarbonModel
 
+search_granularity = 3600 // TIME_FACTOR
+
+
+def set_search_granularity(granularity_seconds: float):
+    """Set the distance between candidate start times evaluated by the oracle and Carbon-Time policies
+
+    Args:
+        granularity_seconds (float): candidate spacing in seconds (default one hour), a positive multiple of
+            TIME_FACTOR, the time step of the simulation
+
+    Raises:
+        ValueError: the spacing is not a positive multiple of TIME_FACTOR
+    """
+    global search_granularity
+    if granularity_seconds <= 0 or granularity_seconds % TIME_FACTOR:
+        raise ValueError(f"Search granularity must be a positive multiple of {TIME_FACTOR} seconds")
+    search_granularity = int(granularity_seconds // TIME_FACTOR)
+
+
 class Schedule:
     def __init__(self, start_time, finish_time, carbon_cost) -> None:
         assert type(start_time) == int
@@ -28,13 +49,69 @@ def compute_carbon_consumption(task: Task, start_time: int, carbon_trace: Carbon
     Returns:
         Schedule: Execution Schedule
     """
-    execution_carbon = carbon_trace.df["carbon_intensity_avg"][start_time:start_time +
-                                                               task.task_length]
-    assert len(execution_carbon) == task.task_length, "Trace is shorter than task"
-    carbon = execution_carbon.sum() * task.CPUs  # 1 watt per core for now
+    assert start_time + task.task_length <= len(carbon_trace), "Trace is shorter than task"
+    carbon = carbon_trace.window_carbon(
+        start_time, start_time + task.task_length) * task.CPUs  # 1 watt per core for now
     return Schedule(start_time, start_time + task.task_length, carbon)
 
 
+def candidate_carbon_costs(task_length: int, CPUs: int, waiting_time: int, carbon_trace: CarbonModel) -> (np.ndarray, np.ndarray):
+    """Carbon cost of every candidate start time in the waiting window, computed in one array operation.
+    Candidates are `search_granularity` apart and windows running off the trace are dropped.
+
+    Args:
+        task_length (int): task length
+        CPUs (int): number of CPUs
+        waiting_time (int): maximum waiting time
+        carbon_trace (CarbonModel): Carbon Sub-trace of the permissible execution period
+
+    Returns:
+        np.ndarray: candidate start times
+        np.ndarray: candidate carbon costs
+    """
+    start_times = np.arange(0, waiting_time + 1, search_granularity)
+    start_times = start_times[start_times + task_length <= len(carbon_trace)]
+    carbon_costs = carbon_trace.window_carbon(
+        start_times, start_times + task_length) * CPUs  # 1 watt per core for now
+    return start_times, carbon_costs
+
+
+def lowest_carbon_start_time(task_length: int, CPUs: int, waiting_time: int, carbon_trace: CarbonModel) -> int:
+    """Candidate start time with the lowest carbon cost (earliest on ties)
+
+    Args:
+        task_length (int): task length
+        CPUs (int): number of CPUs
+        waiting_time (int): maximum waiting time
+        carbon_trace (CarbonModel): Carbon Sub-trace of the permissible execution period
+
+    Returns:
+        int: start time index
+    """
+    start_times, carbon_costs = candidate_carbon_costs(
+        task_length, CPUs, waiting_time, carbon_trace)
+    return int(start_times[np.argmin(carbon_costs)])
+
+
+def carbon_saving_start_time(task_length: int, CPUs: int, waiting_time: int, carbon_trace: CarbonModel) -> int:
+    """Candidate start time with the highest carbon saving per waiting time (earliest on ties)
+
+    Args:
+        task_length (int): task length
+        CPUs (int): number of CPUs
+        waiting_time (int): maximum waiting time
+        carbon_trace (CarbonModel): Carbon Sub-trace of the permissible execution period
+
+    Returns:
+        int: start time index
+    """
+    start_times, carbon_costs = candidate_carbon_costs(
+        task_length, CPUs, waiting_time, carbon_trace)
+    assert len(start_times) > 0 and start_times[0] == 0, "Trace is shorter than task"
+    savings = (carbon_costs[0] - carbon_costs) / (start_times + task_length)
+    return int(start_times[np.argmax(savings)])
+
+
 def lowest_carbon_slot(task: Task, carbon_trace: CarbonModel) -> Schedule:
     """Lowest Carbon Slot Policy that picks the carbon slot with the lowest carbon intensity
 
@@ -46,8 +123,7 @@ def lowest_carbon_slot(task: Task, carbon_trace: CarbonModel) -> Schedule:
         Schedule: Execution Schedule
     """
     if task.waiting_time != 0:
-        start_time = carbon_trace.df[:task.waiting_time + 1]["carbon_intensity_avg"].idxmin(
-        )
+        start_time = carbon_trace.lowest_carbon_index(0, task.waiting_time + 1)
     else:
         start_time = 0
     return compute_carbon_consumption(task, start_time, carbon_trace)
@@ -63,15 +139,9 @@ def oracle_carbon_slot(task: Task, carbon_trace: CarbonModel) -> Schedule:
     Returns:
         Schedule: Execution Schedule
     """
-    schedules = []
-    for i in range(0, task.waiting_time + 1, 3600//TIME_FACTOR):
-        try:
-            s = compute_carbon_consumption(task, i, carbon_trace)
-            schedules.append(s)
-        except:
-            pass
-    schedule = min(schedules, key=lambda x: x.carbon_cost)
-    return schedule
+    start_time = lowest_carbon_start_time(
+        task.task_length, task.CPUs, task.waiting_time, carbon_trace)
+    return compute_carbon_consumption(task, start_time, carbon_trace)
 
 def oracle_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedule:
     """Oracle Carbon Saving per waiting time policy that uses the actual job length
@@ -83,18 +153,9 @@ def oracle_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedul
     Returns:
         Schedule: Execution Schedule
     """
-    schedules = []
-    CA = None
-    for i in range(0, task.waiting_time + 1, 3600//TIME_FACTOR):
-        try:
-            s = compute_carbon_consumption(task, i, carbon_trace)
-            schedules.append(s)            
-            if i == 0:
-                CA = s.carbon_cost
-        except:
-            pass
-    schedule = max(schedules, key=lambda x: (CA - x.carbon_cost)/(x.start_time+ task.task_length))
-    return schedule
+    start_time = carbon_saving_start_time(
+        task.task_length, task.CPUs, task.waiting_time, carbon_trace)
+    return compute_carbon_consumption(task, start_time, carbon_trace)
 
 def average_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedule:
     """Carbon Saving per waiting time policy that uses the average job length
@@ -106,11 +167,9 @@ def average_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedu
     Returns:
         Schedule: Execution Schedule
     """
-    common_task = Task(task.ID, task.arrival_time,
-                       task.expected_time, task.CPUs)
-    common_schedule = oracle_carbon_slot_waiting(common_task, carbon_trace)
-    schedule = compute_carbon_consumption(
-        task, common_schedule.start_time, carbon_trace)
+    start_time = carbon_saving_start_time(
+        task.expected_time, task.CPUs, task.waiting_time, carbon_trace)
+    schedule = compute_carbon_consumption(task, start_time, carbon_trace)
     return schedule
 
 
@@ -124,9 +183,125 @@ def best_waiting_time(task: Task, carbon_trace) -> Schedule:
     Returns:
         Schedule: Execution Schedule
     """
-    common_task = Task(task.ID, task.arrival_time,
-                       task.expected_time, task.CPUs)
-    common_schedule = oracle_carbon_slot(common_task, carbon_trace)
-    schedule = compute_carbon_consumption(
-        task, common_schedule.start_time, carbon_trace)
+    start_time = lowest_carbon_start_time(
+        task.expected_time, task.CPUs, task.waiting_time, carbon_trace)
+    schedule = compute_carbon_consumption(task, start_time, carbon_trace)
     return schedule
+
+
+class DecisionCache:
+    """LRU cache of carbon waiting policy decisions. Tasks submitted at the same time index whose search is identical
+    (same searched length, CPUs and waiting time, e.g. a burst from one queue) reuse the start time.
+    Keys use the exact time index, within a carbon step the candidate windows still shift with the submission time.
+
+    Args:
+        maxsize (int): number of decisions kept
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self.decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, compute_start_time, task: Task, carbon_trace: CarbonModel):
+        """Everything the start time of `compute_start_time` depends on
+
+        Args:
+            compute_start_time (Callable): carbon waiting policy
+            task (Task): current Task
+            carbon_trace (CarbonModel): Carbon Sub-trace of the permissible execution period
+
+        Returns:
+            tuple: cache key
+        """
+        if compute_start_time is lowest_carbon_slot:
+            return (compute_start_time, carbon_trace.offset, min(len(carbon_trace), task.waiting_time + 1), task.waiting_time)
+        if compute_start_time in (best_waiting_time, average_carbon_slot_waiting):
+            search_length = task.expected_time
+        else:
+            search_length = task.task_length
+        # candidates end before search_length + waiting_time, the rest of the sub-trace is never read
+        return (compute_start_time, carbon_trace.offset, min(len(carbon_trace), search_length + task.waiting_time),
+                search_length, task.CPUs, task.waiting_time, search_granularity)
+
+    def schedule(self, compute_start_time, task: Task, carbon_trace: CarbonModel) -> Schedule:
+        """Schedule of `compute_start_time`, reusing a cached start time
+
+        Args:
+            compute_start_time (Callable): carbon waiting policy
+            task (Task): current Task
+            carbon_trace (CarbonModel): Carbon Sub-trace of the permissible execution period
+
+        Returns:
+            Schedule: Execution Schedule
+        """
+        key = self.key(compute_start_time, task, carbon_trace)
+        if key in self.decisions:
+            self.hits += 1
+            self.decisions.move_to_end(key)
+            return compute_carbon_consumption(task, self.decisions[key], carbon_trace)
+        self.misses += 1
+        schedule = compute_start_time(task, carbon_trace)
+        self.decisions[key] = schedule.start_time
+        if len(self.decisions) > self.maxsize:
+            self.decisions.popitem(last=False)
+        return schedule
+
+    def __str__(self):
+        return f"{self.hits} hits, {self.misses} misses"
+
+
+def plan_start_times(compute_start_time, arrival_times: np.ndarray, task_lengths: np.ndarray, expected_times: np.ndarray, waiting_times: np.ndarray, CPUs: np.ndarray, carbon_model: CarbonModel, max_candidates: int = 1 << 22) -> np.ndarray:
+    """Vectorized counterpart of `compute_start_time` for a whole task trace, each task being submitted at its arrival time.
+    The candidate windows of all tasks are scored as one (tasks x candidates) array, in chunks of at most `max_candidates` cells.
+
+    Args:
+        compute_start_time (Callable): carbon waiting policy to plan with
+        arrival_times (np.ndarray): arrival time index of each task
+        task_lengths (np.ndarray): task lengths
+        expected_times (np.ndarray): expected task lengths
+        waiting_times (np.ndarray): maximum waiting times
+        CPUs (np.ndarray): number of CPUs
+        carbon_model (CarbonModel): full carbon trace
+        max_candidates (int): memory bound of a chunk
+
+    Returns:
+        np.ndarray: absolute start time index of each task
+    """
+    # same permissible period as SchedulingPolicy.submit
+    trace_lengths = np.minimum(
+        np.maximum(task_lengths, expected_times) + waiting_times + 1, len(carbon_model) - arrival_times)
+    if compute_start_time is lowest_carbon_slot:
+        start_times = [
+            carbon_model.lowest_carbon_index(arrival_time, arrival_time + min(waiting_time + 1, trace_length)) - arrival_time if waiting_time != 0 else 0
+            for arrival_time, waiting_time, trace_length in zip(arrival_times, waiting_times, trace_lengths)
+        ]
+        return arrival_times + np.array(start_times, dtype=int)
+    if compute_start_time in (oracle_carbon_slot, oracle_carbon_slot_waiting):
+        search_lengths = task_lengths
+    elif compute_start_time in (best_waiting_time, average_carbon_slot_waiting):
+        search_lengths = expected_times
+    else:
+        raise Exception("Unknown Carbon Policy")
+    per_waiting_time = compute_start_time in (oracle_carbon_slot_waiting, average_carbon_slot_waiting)
+
+    candidates = np.arange(0, waiting_times.max(initial=0) + 1, search_granularity)
+    start_times = np.empty(len(arrival_times), dtype=int)
+    chunk = max(1, max_candidates // len(candidates))
+    for begin in range(0, len(arrival_times), chunk):
+        rows = slice(begin, begin + chunk)
+        lengths = search_lengths[rows, None]
+        valid = (candidates <= waiting_times[rows, None]) & (candidates + lengths <= trace_lengths[rows, None])
+        window_starts = arrival_times[rows, None] + candidates
+        carbon_costs = carbon_model.window_carbon(
+            window_starts, window_starts + lengths) * CPUs[rows, None]
+        if per_waiting_time:
+            assert valid[:, 0].all(), "Trace is shorter than task"
+            savings = (carbon_costs[:, :1] - carbon_costs) / (candidates + lengths)
+            best = np.argmax(np.where(valid, savings, -np.inf), axis=1)
+        else:
+            assert valid.any(axis=1).all(), "Trace is shorter than task"
+            best = np.argmin(np.where(valid, carbon_costs, np.inf), axis=1)
+        start_times[rows] = candidates[best]
+    return arrival_times + start_times
@@ -0,0 +1,164 @@
+import bisect
+import heapq
+from itertools import count
+from typing import List
+
+
+class QueueObject:
+    _counter = count()
+
+    def __init__(self, task, max_start_time, priority) -> None:
+        self.task = task
+        self.max_start_time = max_start_time
+        self.priority = priority
+        # equal priorities are served in submission order, independent of how often the queue is rebuilt
+        self.sequence = next(QueueObject._counter)
+        self.removed = False
+        self.work_conserving = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def __str__(self):
+        return str(self.x)
+
+
+class IntervalQueueObject(QueueObject):
+    """Suspend-resume job executed as run-length intervals of its task, `max_start_time` is the start of the current interval.
+    The same object is queued again for each interval, so runs keep the queue order of their task.
+
+    Args:
+        task (Task): suspended task
+        submit_time (int): time index the intervals are relative to
+        starts (np.ndarray): start of each interval
+        lengths (np.ndarray): length of each interval
+        task_length_classes (np.ndarray): length class each interval runs with
+        priority (int): queue priority
+    """
+
+    def __init__(self, task, submit_time, starts, lengths, task_length_classes, priority) -> None:
+        super().__init__(task, submit_time + int(starts[0]), priority)
+        self.submit_time = submit_time
+        self.starts = starts
+        self.lengths = lengths
+        self.task_length_classes = task_length_classes
+        self.cursor = 0
+
+    def advance(self):
+        """Move to the next interval
+
+        Returns:
+            bool: False if the task has no interval left
+        """
+        self.cursor += 1
+        if self.cursor >= len(self.starts):
+            return False
+        self.max_start_time = self.submit_time + int(self.starts[self.cursor])
+        return True
+
+
+class ReadyQueue:
+    """GAIA queue indexed on `max_start_time` so each tick only touches the jobs that are due.
+    Jobs that may run early on reserved instances are also indexed by CPU demand, one bucket per CPU count
+    ordered by priority, so the highest priority job that fits the free capacity is found without a scan.
+    Dispatched jobs are marked as removed and dropped lazily from the heaps.
+    """
+
+    def __init__(self) -> None:
+        self.ready_heap = []
+        self.demand_index = {}
+        self.demands = []
+        self.indexed = 0
+        self.index_entries = 0
+        self.size = 0
+
+    def put(self, queue_object: QueueObject, work_conserving: bool = False):
+        """Add a job
+
+        Args:
+            queue_object (QueueObject): queued job
+            work_conserving (bool): the job may start early on reserved instances
+        """
+        queue_object.removed = False
+        heapq.heappush(self.ready_heap, (queue_object.max_start_time, queue_object))
+        if work_conserving:
+            CPUs = queue_object.task.CPUs
+            if CPUs not in self.demand_index:
+                self.demand_index[CPUs] = []
+                bisect.insort(self.demands, CPUs)
+            heapq.heappush(self.demand_index[CPUs], queue_object)
+            queue_object.work_conserving = True
+            self.indexed += 1
+            self.index_entries += 1
+        self.size += 1
+
+    def pop_ready(self, current_time: int) -> List[QueueObject]:
+        """Remove the jobs whose `max_start_time` is reached
+
+        Args:
+            current_time (int): time index
+
+        Returns:
+            List[QueueObject]: ready jobs in priority order
+        """
+        ready = []
+        while len(self.ready_heap) > 0 and self.ready_heap[0][0] <= current_time:
+            _, queue_object = heapq.heappop(self.ready_heap)
+            if not queue_object.removed:
+                self.remove(queue_object)
+                ready.append(queue_object)
+        ready.sort()
+        return ready
+
+    def peek_fitting(self, capacity: int) -> QueueObject:
+        """Highest priority work conserving job that needs at most `capacity` CPUs
+
+        Args:
+            capacity (int): free reserved CPUs
+
+        Returns:
+            QueueObject: waiting job, None if no job fits
+        """
+        best = None
+        for CPUs in self.demands[:bisect.bisect_right(self.demands, capacity)]:
+            bucket = self.demand_index[CPUs]
+            while len(bucket) > 0 and bucket[0].removed:
+                heapq.heappop(bucket)
+                self.index_entries -= 1
+            if len(bucket) > 0 and (best is None or bucket[0] < best):
+                best = bucket[0]
+        return best
+
+    def remove(self, queue_object: QueueObject):
+        """Remove a job before its `max_start_time`, e.g. when it runs early on reserved instances
+
+        Args:
+            queue_object (QueueObject): queued job
+        """
+        queue_object.removed = True
+        self.size -= 1
+        if queue_object.work_conserving:
+            self.indexed -= 1
+            if self.index_entries > 2 * self.indexed + 64:
+                for CPUs, bucket in self.demand_index.items():
+                    self.demand_index[CPUs] = [item for item in bucket if not item.removed]
+                    heapq.heapify(self.demand_index[CPUs])
+                self.index_entries = self.indexed
+
+    def next_ready_time(self):
+        """Earliest `max_start_time` in the queue
+
+        Returns:
+            int: time index, None if the queue is empty
+        """
+        while len(self.ready_heap) > 0 and self.ready_heap[0][1].removed:
+            heapq.heappop(self.ready_heap)
+        if len(self.ready_heap) == 0:
+            return None
+        return self.ready_heap[0][0]
+
+    def empty(self):
+        return self.size == 0
+
+    def __len__(self):
+        return self.size
@@ -1,29 +1,19 @@
 from typing import Callable
+import numpy as np
 from carbon import CarbonModel
-from task import Task
-from .carbon_waiting_policy import Schedule
-from queue import PriorityQueue
+from task import Task, TaskTable
+from .carbon_waiting_policy import DecisionCache, Schedule, plan_start_times
+from .ready_queue import QueueObject, ReadyQueue
 from cluster import BaseCluster
 
-class QueueObject:
-    def __init__(self, task, max_start_time, priority) -> None:
-        self.task = task
-        self.max_start_time = max_start_time
-        self.priority = priority
-
-    def __lt__(self, other):
-        return self.priority < other.priority
-
-    def __str__(self):
-        return str(self.x)
-
 class SchedulingPolicy():
     def __init__(self, cluster:BaseCluster, carbon_model, compute_start_time, carbon_aware, cost_aware, spot_aware) -> None:
         self.cluster = cluster
         self.carbon_model: CarbonModel = carbon_model
         self.compute_start_time: Callable[[
             Task, CarbonModel], Schedule] = compute_start_time        
-        self.queue: PriorityQueue = PriorityQueue()
+        self.queue: ReadyQueue = ReadyQueue()
+        self.decisions = DecisionCache()
         self.carbon_aware = carbon_aware
         self.cost_aware = cost_aware
         self.spot_aware = spot_aware
@@ -39,15 +29,50 @@ class SchedulingPolicy():
             try:
                 c_model = self.carbon_model.subtrace(
                     current_time, current_time + max(task.task_length, task.expected_time) + task.waiting_time + 1)
-                schedule = self.compute_start_time(task, c_model)
+                schedule = self.decisions.schedule(self.compute_start_time, task, c_model)
                 self.queue.put(QueueObject(
-                    task, schedule.actual_start_time(current_time), task.arrival_time))
+                    task, schedule.actual_start_time(current_time), task.arrival_time), self.work_conserving(task))
             except:
                 print("RealClusterCost: Submit Error")
                 raise
         else:
             self.queue.put(QueueObject(
-                task, task.waiting_time + current_time, task.arrival_time))
+                task, task.waiting_time + current_time, task.arrival_time), self.work_conserving(task))
+
+    def submit_batch(self, tasks: TaskTable):
+        """Plan the whole task trace at once and account it in the cluster in bulk.
+        Only valid for capacity-free policies (carbon aware but not cost aware) where the start time
+        does not depend on the cluster state, gives the same results as submitting tasks one by one.
+
+        Args:
+            tasks (TaskTable): Task trace
+        """
+        if not self.carbon_aware or self.cost_aware:
+            raise Exception("Batch planning needs a carbon aware and capacity-free policy")
+        submitted = np.flatnonzero((tasks.task_length > 0) & (tasks.arrival_time < len(self.carbon_model)))
+        start_times = plan_start_times(
+            self.compute_start_time,
+            tasks.arrival_time[submitted],
+            tasks.task_length[submitted],
+            tasks.expected_time[submitted],
+            tasks.waiting_time[submitted],
+            tasks.CPUs[submitted],
+            self.carbon_model,
+        )
+        # jobs planned after the end of the trace never start
+        planned = start_times < len(self.carbon_model)
+        self.cluster.submit_batch(start_times[planned], [tasks[i] for i in submitted[planned]])
+
+    def work_conserving(self, task: Task):
+        """Whether a waiting job may start before its `max_start_time` when reserved instances are free
+
+        Args:
+            task (Task): Task
+
+        Returns:
+            bool: True for work conserving (not spot) and partial work conserving (long jobs only) policies
+        """
+        return self.cost_aware and (not self.spot_aware or task.task_length_class != "0-2")
 
     def execute(self, current_time):
         """Submit ready job to the simulated or real cluster queue
@@ -55,20 +80,25 @@ class SchedulingPolicy():
         Args:
             current_time (int): time index
         """
-        queue = PriorityQueue()
-        while not self.queue.empty():
-            queue_object = self.queue.get()
-            if current_time >= queue_object.max_start_time:
-                # Submit if ready
-                self.cluster.submit(current_time, queue_object.task)
-            elif self.cost_aware and not self.spot_aware and self.cluster.available_reserved_instances >= queue_object.task.CPUs:
-                # Submit if work conserving (not spot) and available resources
-                self.cluster.submit(current_time, queue_object.task)
-            elif self.cost_aware and self.spot_aware and queue_object.task.task_length_class != "0-2" and self.cluster.available_reserved_instances >= queue_object.task.CPUs:
-                # Submit if partial work conserving (long jobs only) and available resources
-                self.cluster.submit(current_time, queue_object.task)
+        ready = self.queue.pop_ready(current_time)
+        i = 0
+        while True:
+            # next job in priority order: a ready job, or a waiting job that fits the free reserved instances
+            early = self.queue.peek_fitting(self.cluster.available_reserved_instances)
+            if i < len(ready) and (early is None or ready[i] < early):
+                self.cluster.submit(current_time, ready[i].task)
+                i += 1
+            elif early is not None:
+                self.queue.remove(early)
+                self.cluster.submit(current_time, early.task)
             else:
-                queue.put(queue_object)
-        self.queue = queue
+                break
         self.cluster.refresh_data(current_time)
-        
\ No newline at end of file
+
+    def next_event_time(self):
+        """Earliest time index at which a queued job becomes ready
+
+        Returns:
+            int: next ready time index, None if the queue is empty
+        """
+        return self.queue.next_ready_time()
@@ -1,22 +1,26 @@
 from typing import Callable
+import numpy as np
 from carbon import CarbonModel
-from task import TIME_FACTOR, Task
-from .carbon_waiting_policy import Schedule
-from queue import PriorityQueue
+from task import TIME_FACTOR, Task, classify_time_array
+from .ready_queue import IntervalQueueObject, QueueObject, ReadyQueue
 from cluster import BaseCluster
 
 
-class QueueObject:
-    def __init__(self, task, max_start_time, priority) -> None:
-        self.task = task
-        self.max_start_time = max_start_time
-        self.priority = priority
+def merge_intervals(starts: np.ndarray, lengths: np.ndarray):
+    """Merge sorted disjoint intervals that touch each other
 
-    def __lt__(self, other):
-        return self.priority < other.priority
+    Args:
+        starts (np.ndarray): sorted interval starts
+        lengths (np.ndarray): interval lengths
 
-    def __str__(self):
-        return str(self.x)
+    Returns:
+        np.ndarray: start time index of each execution interval
+        np.ndarray: length of each execution interval
+    """
+    ends = starts + lengths
+    first = np.flatnonzero(np.concatenate(([True], starts[1:] != ends[:-1])))
+    last = np.concatenate((first[1:], [len(starts)])) - 1
+    return starts[first], ends[last] - starts[first]
 
 
 class SuspendSchedulingPolicy:
@@ -27,60 +31,55 @@ class SuspendSchedulingPolicy:
     def __init__(self, cluster: BaseCluster, carbon_model, optimal) -> None:
         self.cluster = cluster
         self.carbon_model: CarbonModel = carbon_model
-        self.queue: PriorityQueue = PriorityQueue()
+        self.queue: ReadyQueue = ReadyQueue()
         self.optimal = optimal
 
-    def compute_schedule_optimal(self, carbon_trace, task: Task):
-        """Compute Suspend Resume Schedule WaitAwhile Optimal
+    def compute_schedule_optimal(self, carbon_trace: CarbonModel, task: Task):
+        """Compute Suspend Resume Schedule WaitAwhile Optimal, the `task_length` lowest carbon time indices (earliest on ties).
+        The trace is constant between carbon samples, so pieces are ranked instead of single time indices
+        and a partially used piece contributes its earliest time indices.
 
         Args:
             carbon_trace (CarbonModel): Carbon Intensity model
             task (Task): current task
 
         Returns:
-            List: execution schedule
+            np.ndarray: start time index of each execution interval
+            np.ndarray: length of each execution interval
         """
-        job_length = task.task_length
-        task_schedule = [0] * (task.task_length + task.waiting_time)
-        assert len(task_schedule) == carbon_trace.shape[0]
-        carbon_trace.sort_values(
-            by=[
-                "carbon_intensity_avg",
-                "index",
-            ],
-            inplace=True,
-        )
-        for i, row in carbon_trace.iterrows():
-            if job_length <= 0:
-                break
-            task_schedule[i] = 1
-            job_length -= 1
-        return task_schedule
-
-    def compute_schedule_threshold(self, df, task: Task, mean_value):
-        """Compute Suspend Resume Schedule WaitAwhile Threshold - Ecovisor
+        assert task.task_length + task.waiting_time == len(carbon_trace)
+        starts, counts, rates = carbon_trace.steps()
+        order = np.lexsort((starts, rates))
+        starts, counts = starts[order], counts[order]
+        lengths = np.clip(task.task_length - (np.cumsum(counts) - counts), 0, counts)
+        selected = np.argsort(starts[lengths > 0])
+        return merge_intervals(starts[lengths > 0][selected], lengths[lengths > 0][selected])
+
+    def compute_schedule_threshold(self, carbon_trace: CarbonModel, task: Task, mean_value):
+        """Compute Suspend Resume Schedule WaitAwhile Threshold - Ecovisor.
+        The job runs whenever the carbon intensity is below the threshold and is suspended otherwise, until the waiting time is used up.
+        Suspensions are counted cumulatively over the constant pieces of the trace, a piece above the threshold
+        is suspended at its beginning for whatever waiting time is left.
 
         Args:
             carbon_trace (CarbonModel): Carbon Intensity model
             task (Task): current task
+            mean_value (float): carbon intensity threshold
 
         Returns:
-            List: execution schedule
+            np.ndarray: start time index of each execution interval
+            np.ndarray: length of each execution interval
         """
-        job_length = task.task_length
-        task_schedule = [0] * (task.task_length + task.waiting_time)
-        assert len(task_schedule) == df.shape[0]
-        remaining_waiting = task.waiting_time
-        for i in range(0, len(task_schedule)):
-            if job_length <= 0:
-                break
-            if df["carbon_intensity_avg"][i] < mean_value or remaining_waiting <= 0:
-                task_schedule[i] = 1
-                job_length -= 1
-            else:
-                remaining_waiting -= 1
-        assert job_length == 0
-        return task_schedule
+        assert task.task_length + task.waiting_time == len(carbon_trace)
+        starts, counts, rates = carbon_trace.steps()
+        suspended = np.cumsum(np.where(rates < mean_value, 0, counts))
+        suspended = np.minimum(suspended, task.waiting_time)
+        suspended = suspended - np.concatenate(([0], suspended[:-1]))
+        running = counts - suspended
+        lengths = np.clip(task.task_length - (np.cumsum(running) - running), 0, running)
+        assert lengths.sum() == task.task_length
+        executed = lengths > 0
+        return merge_intervals((starts + suspended)[executed], lengths[executed])
 
     def submit(self, current_time: int, task: Task):
         """Split Task to multiple jobs (suspend-resume) and submit them to GAIA Queue
@@ -94,42 +93,28 @@ class SuspendSchedulingPolicy:
                 current_time, current_time + task.task_length + task.waiting_time
             )
             if self.optimal:
-                schedule = self.compute_schedule_optimal(c_model.df, task)
+                starts, lengths = self.compute_schedule_optimal(c_model, task)
             else:
-                mean_value = self.carbon_model.df[
-                    current_time : current_time + int(3600 / TIME_FACTOR * 24)
-                ]["carbon_intensity_avg"].quantile(0.3)
-                schedule = self.compute_schedule_threshold(c_model.df, task, mean_value)
-
-            sub_tasks = []
-            start_times = []
-            tasks = 0
-            i = 0
-            while i < len(schedule):
-                if schedule[i] == 0:
-                    i += 1
-                    continue
-                start = i
-                while i < len(schedule) and schedule[i] == 1:
-                    i = i + 1
-                subtask = Task(task.ID, current_time, i - start, task.CPUs)
-                if not self.optimal:
-                    subtask.task_length_class = task.task_length_class
-                sub_tasks.append(subtask)
-                start_times.append(start)
-                tasks += 1
-            assert tasks >= 1 and tasks == len(sub_tasks)
-            if tasks == 1:
+                mean_value = self.carbon_model.subtrace(
+                    current_time, current_time + int(3600 / TIME_FACTOR * 24)
+                ).quantile(0.3)
+                starts, lengths = self.compute_schedule_threshold(c_model, task, mean_value)
+
+            assert len(starts) >= 1 and lengths.sum() == task.task_length
+            if len(starts) == 1:
                 self.queue.put(
-                    QueueObject(task, current_time + start_times[0], task.arrival_time)
+                    QueueObject(task, current_time + int(starts[0]), task.arrival_time)
                 )
             else:
-                for i, subtask in enumerate(sub_tasks):
-                    self.queue.put(
-                        QueueObject(
-                            subtask, current_time + start_times[i], task.arrival_time
-                        )
+                if self.optimal:
+                    task_length_classes = classify_time_array(lengths)
+                else:
+                    task_length_classes = np.full(len(lengths), task.task_length_class)
+                self.queue.put(
+                    IntervalQueueObject(
+                        task, current_time, starts, lengths, task_length_classes, task.arrival_time
                     )
+                )
         except:
             print("RealClusterCost: Submit Error")
             raise
@@ -140,12 +125,25 @@ class SuspendSchedulingPolicy:
         Args:
             current_time (int): time index
         """
-        queue = PriorityQueue()
-        while not self.queue.empty():
-            queue_object = self.queue.get()
-            if current_time >= queue_object.max_start_time:
+        for queue_object in self.queue.pop_ready(current_time):
+            if not isinstance(queue_object, IntervalQueueObject):
                 self.cluster.submit(current_time, queue_object.task)
-            else:
-                queue.put(queue_object)
-        self.queue = queue
+                continue
+            self.cluster.submit(
+                current_time,
+                queue_object.task,
+                task_length=int(queue_object.lengths[queue_object.cursor]),
+                task_length_class=str(queue_object.task_length_classes[queue_object.cursor]),
+                arrival_time=queue_object.submit_time,
+            )
+            if queue_object.advance():
+                self.queue.put(queue_object)
         self.cluster.refresh_data(current_time)
+
+    def next_event_time(self):
+        """Earliest time index at which a queued job becomes ready
+
+        Returns:
+            int: next ready time index, None if the queue is empty
+        """
+        return self.queue.next_ready_time()
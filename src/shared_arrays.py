@@ -0,0 +1,84 @@
+from multiprocessing import shared_memory
+from typing import Dict
+import numpy as np
+from task import TaskTable
+
+TASK_COLUMNS = ["ID", "arrival_time", "task_length", "task_length_class", "CPUs", "CPUs_class"]
+
+# shared memory blocks attached by this process, they must outlive the arrays built on them
+attached_blocks = []
+
+
+class SharedArrays:
+    """Shared memory copies of named NumPy arrays, owned by the process that creates them.
+    `spec` is a small picklable description that other processes pass to `attach_arrays`.
+
+    Args:
+        arrays (Dict[str, np.ndarray]): arrays to share, numeric or fixed width string dtypes
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """Release the shared memory, attached processes must be done with it"""
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach_arrays(spec: dict) -> Dict[str, np.ndarray]:
+    """Read-only views of arrays shared by another process
+
+    Args:
+        spec (dict): `SharedArrays.spec`
+
+    Returns:
+        Dict[str, np.ndarray]: arrays by name
+    """
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        attached_blocks.append(block)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    return arrays
+
+
+def share_task_table(tasks: TaskTable) -> SharedArrays:
+    """Share the trace columns of a task table, queues depend on the waiting times and stay per process
+
+    Args:
+        tasks (TaskTable): Columnar Task trace
+
+    Returns:
+        SharedArrays: shared columns
+    """
+    return SharedArrays({column: getattr(tasks, column) for column in TASK_COLUMNS})
+
+
+def attach_task_table(spec: dict) -> TaskTable:
+    """Task table on columns shared by `share_task_table`, nothing is copied or reclassified
+
+    Args:
+        spec (dict): `SharedArrays.spec` of the task columns
+
+    Returns:
+        TaskTable: Columnar Task trace with queues assigned from the current waiting times
+    """
+    return TaskTable.from_arrays(**attach_arrays(spec))
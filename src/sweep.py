@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import task as task_module
+from carbon import get_carbon_model, CarbonModel
+from task import TaskTable, set_waiting_times, load_tasks, TIME_FACTOR
+from scheduling import set_search_granularity
+import result_cache
+from run import run_experiment, result_file_name, get_experiment_name
+from shared_arrays import share_task_table, attach_task_table
+
+SUMMARY_COLUMNS = [
+    "carbon_trace",
+    "task_trace",
+    "scheduling_policy",
+    "carbon_policy",
+    "waiting_times",
+    "reserved_instances",
+    "carbon_start_index",
+    "carbon_cost",
+    "dollar_cost",
+    "seconds",
+]
+
+# traces loaded by this worker process, reused by every experiment it runs
+carbon_models = {}
+task_tables = {}
+# task columns shared by the sweep process, with the average lengths of each trace
+shared_tasks = {}
+
+
+def init_worker(task_specs: dict):
+    """Process pool initializer, records the task traces shared by the sweep process
+
+    Args:
+        task_specs (dict): shared column spec and average lengths by task trace
+    """
+    shared_tasks.update(task_specs)
+
+
+def get_worker_carbon_model(carbon_trace: str, carbon_start_index: int) -> CarbonModel:
+    """Carbon model of the worker, loaded once per trace and start index
+
+    Args:
+        carbon_trace (str): carbon trace name
+        carbon_start_index (int): carbon trace start time
+
+    Returns:
+        CarbonModel: extended carbon model
+    """
+    key = (carbon_trace, carbon_start_index)
+    if key not in carbon_models:
+        carbon_models[key] = get_carbon_model(carbon_trace, carbon_start_index).extend(3600 / TIME_FACTOR)
+    return carbon_models[key]
+
+
+def get_worker_tasks(task_trace: str, waiting_times_str: str) -> TaskTable:
+    """Task table of the worker, loaded once per trace. Queues are reassigned for the waiting times of each experiment
+
+    Args:
+        task_trace (str): task trace name
+        waiting_times_str (str): waiting times per queue
+
+    Returns:
+        TaskTable: Columnar Task trace
+    """
+    set_waiting_times(waiting_times_str)
+    if task_trace in shared_tasks and task_trace not in task_tables:
+        spec, average_length = shared_tasks[task_trace]
+        task_module.set_average_length(average_length)
+        task_tables[task_trace] = (attach_task_table(spec), average_length)
+    elif task_trace not in task_tables:
+        tasks = load_tasks(task_trace)
+        task_tables[task_trace] = (tasks, task_module.average_length)
+    tasks, average_length = task_tables[task_trace]
+    task_module.set_average_length(average_length)
+    tasks.assign_queues()
+    return tasks
+
+
+def run_configuration(configuration: dict) -> dict:
+    """Run one grid point of the sweep in a worker process
+
+    Args:
+        configuration (dict): grid point, the summary columns up to `carbon_start_index` and the run options
+
+    Returns:
+        dict: summary row
+    """
+    start = time.time()
+    file_name = result_file_name(
+        "simulation",
+        configuration["carbon_start_index"],
+        configuration["carbon_trace"],
+        configuration["task_trace"],
+        configuration["scheduling_policy"],
+        configuration["carbon_policy"],
+        configuration["reserved_instances"],
+        configuration["waiting_times"],
+    )
+    key = result_cache.result_key(
+        get_experiment_name(
+            configuration["carbon_trace"],
+            configuration["carbon_start_index"],
+            configuration["scheduling_policy"],
+            configuration["carbon_policy"],
+            configuration["waiting_times"],
+            configuration["reserved_instances"],
+            configuration["task_trace"],
+            "queue1",
+        ),
+        "simulation",
+        configuration["search_granularity"],
+        configuration["carbon_trace"],
+        configuration["task_trace"],
+    )
+    row = {column: configuration[column] for column in SUMMARY_COLUMNS[:7]}
+    if not configuration["force"] and result_cache.lookup(key, file_name):
+        results = pd.read_csv(file_name)
+        row.update(carbon_cost=results["carbon_cost"][0], dollar_cost=results["dollar_cost"][0], seconds=0.0)
+        return row
+    set_search_granularity(configuration["search_granularity"])
+    carbon_model = get_worker_carbon_model(
+        configuration["carbon_trace"], configuration["carbon_start_index"])
+    tasks = get_worker_tasks(configuration["task_trace"], configuration["waiting_times"])
+    batch = configuration["batch"] and configuration["scheduling_policy"] in ["carbon", "carbon-spot"]
+    carbon_cost, dollar_cost = run_experiment(
+        "simulation",
+        configuration["carbon_start_index"],
+        carbon_model,
+        tasks,
+        configuration["scheduling_policy"],
+        configuration["carbon_policy"],
+        configuration["reserved_instances"],
+        configuration["task_trace"],
+        configuration["waiting_times"],
+        "queue1",
+        batch,
+    )
+    results = pd.DataFrame([[carbon_cost, dollar_cost]], columns=["carbon_cost", "dollar_cost"])
+    results.to_csv(file_name, index=False)
+    result_cache.record(key, file_name, {
+        column: configuration[column] for column in SUMMARY_COLUMNS[:7] + ["search_granularity"]
+    })
+    row.update(carbon_cost=carbon_cost, dollar_cost=dollar_cost, seconds=time.time() - start)
+    return row
+
+
+def share_task_traces(task_traces, waiting_times_str: str) -> dict:
+    """Load each task trace once and share its columns with the workers
+
+    Args:
+        task_traces (List[str]): task trace names
+        waiting_times_str (str): waiting times used while loading
+
+    Returns:
+        dict: `SharedArrays` and average lengths by task trace
+    """
+    set_waiting_times(waiting_times_str)
+    shared = {}
+    for task_trace in task_traces:
+        tasks = load_tasks(task_trace)
+        shared[task_trace] = (share_task_table(tasks), task_module.average_length)
+    return shared
+
+
+def sweep(configurations, jobs: int, summary_file: str, shared: dict = None):
+    """Run the configurations on a process pool, each result is appended to the summary as soon as it completes.
+    Configurations with cached results are not rerun, so an interrupted sweep resumes where it stopped.
+
+    Args:
+        configurations (List[dict]): grid points
+        jobs (int): number of worker processes
+        summary_file (str): summary csv file
+        shared (dict): task traces shared with the workers, from `share_task_traces`
+    """
+    os.makedirs(os.path.dirname(summary_file) or ".", exist_ok=True)
+    write_header = True
+    failed = 0
+    task_specs = {
+        task_trace: (arrays.spec, average_length) for task_trace, (arrays, average_length) in (shared or {}).items()
+    }
+    with open(summary_file, "w") as summary, ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker, initargs=(task_specs,)
+    ) as executor:
+        futures = {executor.submit(run_configuration, configuration): configuration for configuration in configurations}
+        for done, future in enumerate(as_completed(futures), start=1):
+            configuration = futures[future]
+            try:
+                row = future.result()
+            except Exception:
+                failed += 1
+                print(f"Failed {configuration}")
+                traceback.print_exc()
+                continue
+            pd.DataFrame([row], columns=SUMMARY_COLUMNS).to_csv(summary, header=write_header, index=False)
+            summary.flush()
+            write_header = False
+            print(f"[{done}/{len(futures)}] {row['scheduling_policy']}-{row['carbon_policy']}-{row['waiting_times']}-"
+                  f"{row['reserved_instances']}-{row['carbon_start_index']} took {row['seconds']:.1f}s")
+    print(f"Finished {len(configurations) - failed}/{len(configurations)} experiments, summary in {summary_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="GAIA: parallel parameter sweep over simulation experiments"
+    )
+    parser.add_argument("-c", "--carbon-trace", nargs="+", default=["AU-SA"], dest="carbon_traces", help="Carbon Traces")
+    parser.add_argument("-t", "--task-trace", nargs="+", default=["pai_1k"], dest="task_traces", help="Task Traces")
+    parser.add_argument(
+        "-r",
+        "--reserved-instances",
+        nargs="+",
+        type=int,
+        default=[0],
+        dest="reserved_instances",
+        help="Reserved Instances",
+    )
+    parser.add_argument(
+        "-w",
+        "--waiting-times",
+        nargs="+",
+        default=["6x24"],
+        dest="waiting_times",
+        help="Waiting times per queue `x` separated",
+    )
+    parser.add_argument(
+        "--scheduling-policy",
+        nargs="+",
+        default=["suspend-resume-spot-threshold"],
+        dest="scheduling_policies",
+        choices=[
+            "carbon",
+            "carbon-spot",
+            "carbon-cost",
+            "carbon-cost-spot",
+            "cost",
+            "suspend-resume",
+            "suspend-resume-spot",
+            "suspend-resume-threshold",
+            "suspend-resume-spot-threshold",
+        ],
+    )
+    parser.add_argument(
+        "--carbon-policy",
+        nargs="+",
+        default=["oracle"],
+        dest="carbon_policies",
+        choices=["waiting", "lowest", "oracle", "cst_oracle", "cst_average"],
+    )
+    parser.add_argument(
+        "-i",
+        "--start-index",
+        nargs="+",
+        type=int,
+        default=[7000],
+        dest="start_indices",
+        help="carbon start indices, -1 for all of range(0, 8500, 500)",
+    )
+    parser.add_argument(
+        "-g",
+        "--search-granularity",
+        type=float,
+        default=3600,
+        dest="search_granularity",
+        help=f"Seconds between candidate start times of the carbon policies, a multiple of {TIME_FACTOR}",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        dest="batch",
+        help="Plan the whole task trace at once for the carbon and carbon-spot scheduling policies",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), dest="jobs", help="Worker processes"
+    )
+    parser.add_argument(
+        "-o",
+        "--summary",
+        default="results/simulation/sweep-summary.csv",
+        dest="summary_file",
+        help="Summary csv, one row per experiment appended as it completes",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        dest="force",
+        help="Rerun experiments whose results are cached",
+    )
+
+    args = parser.parse_args()
+    if args.search_granularity <= 0 or args.search_granularity % TIME_FACTOR:
+        parser.error(f"--search-granularity must be a positive multiple of {TIME_FACTOR} seconds")
+    start_indices = []
+    for start_index in args.start_indices:
+        start_indices += list(range(0, 8500, 500)) if start_index == -1 else [start_index]
+    configurations = [
+        dict(
+            carbon_trace=carbon_trace,
+            task_trace=task_trace,
+            scheduling_policy=scheduling_policy,
+            carbon_policy=carbon_policy,
+            waiting_times=waiting_times,
+            reserved_instances=reserved_instances,
+            carbon_start_index=carbon_start_index,
+            search_granularity=args.search_granularity,
+            batch=args.batch,
+            force=args.force,
+        )
+        for carbon_trace, task_trace, scheduling_policy, carbon_policy, waiting_times, reserved_instances, carbon_start_index in itertools.product(
+            args.carbon_traces,
+            args.task_traces,
+            args.scheduling_policies,
+            args.carbon_policies,
+            args.waiting_times,
+            args.reserved_instances,
+            start_indices,
+        )
+    ]
+    shared = share_task_traces(args.task_traces, args.waiting_times[0])
+    try:
+        sweep(configurations, args.jobs, args.summary_file, shared)
+    finally:
+        for arrays, _ in shared.values():
+            arrays.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from enum import Enum
 import timeit
 from typing import List
+import numpy as np
 import pandas as pd
 
 TIME_FACTOR = 5
@@ -54,6 +55,34 @@ def get_expected_time(task_length_hours: float) -> (int, int, str):
         raise Exception("Not covered")
 
 
+def get_expected_time_array(task_lengths: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Vectorized get_expected_time for a whole trace
+
+    Args:
+        task_lengths (np.ndarray): Task lengths
+
+    Raises:
+        Exception: Wrong waiting time array
+
+    Returns:
+        np.ndarray: Expected lengths
+        np.ndarray: Waiting Times
+        np.ndarray: Queue Names
+    """
+    global average_length
+    global waiting_times
+
+    if len(waiting_times) == 1:
+        return np.full(len(task_lengths), 2), np.full(len(task_lengths), waiting_times[0]), np.full(len(task_lengths), 'Same')
+    elif len(waiting_times) == 2:
+        short = task_lengths < TwoQueues.Short.value
+        return (np.where(short, average_length[0], average_length[1]),
+                np.where(short, waiting_times[0], waiting_times[1]),
+                np.where(short, TwoQueues.Short.name, TwoQueues.Long.name))
+    else:
+        raise Exception("Not covered")
+
+
 def classify_time(length):
     """Map Task length to length class
 
@@ -105,7 +134,39 @@ def classify_resources(x):
         return "64+"
 
 
+def classify_time_array(lengths: np.ndarray) -> np.ndarray:
+    """Vectorized classify_time
+
+    Args:
+        lengths (np.ndarray): job lengths
+
+    Returns:
+        np.ndarray: length classes
+    """
+    classes = np.array(["0-2", "2-6", "6-12", "12-24", "24-48", "48+"])
+    return classes[np.digitize(lengths / (3600/TIME_FACTOR), [2, 4, 8, 16, 48], right=True)]
+
+
+def classify_resources_array(x: np.ndarray) -> np.ndarray:
+    """Vectorized classify_resources
+
+    Args:
+        x (np.ndarray): job resources
+
+    Returns:
+        np.ndarray: resources classes
+    """
+    return np.select(
+        [x == 1, x == 2, x <= 4, x <= 8, x <= 16, x <= 32, x <= 64],
+        ["1", "2", "3-4", "5-8", "9-16", "17-32", "33-64"],
+        "64+",
+    )
+
+
 class Task:
+    __slots__ = ("ID", "arrival_time", "task_length", "task_length_class", "expected_time",
+                 "CPUs", "CPUs_class", "queue", "waiting_time", "reserved")
+
     def __init__(self, id:int, arrival_time: float, task_length: float, CPUs: int) -> None:
         """Task Class
 
@@ -127,19 +188,179 @@ class Task:
         self.queue = queue
         self.waiting_time = int(waiting_time)
 
+    @classmethod
+    def from_columns(cls, id: int, arrival_time: int, task_length: int, task_length_class: str, expected_time: int,
+                     CPUs: int, CPUs_class: str, queue: str, waiting_time: int) -> "Task":
+        """Build a Task from already classified values (see TaskTable) without re-running the classification
+
+        Returns:
+            Task: Task
+        """
+        task = cls.__new__(cls)
+        task.ID = id
+        task.arrival_time = arrival_time
+        task.task_length = task_length
+        task.task_length_class = task_length_class
+        task.expected_time = expected_time
+        task.CPUs = CPUs
+        task.CPUs_class = CPUs_class
+        task.queue = queue
+        task.waiting_time = waiting_time
+        return task
+
+
+class TaskTable:
+    """Columnar Task trace, one NumPy array per Task attribute.
+    Classes and queues are computed for the whole trace at once and Task objects are only built on request.
+
+    Args:
+        ids (np.ndarray): task IDs
+        arrival_times (np.ndarray): arrival times
+        task_lengths (np.ndarray): task lengths
+        CPUs (np.ndarray): number of CPUs
+    """
+
+    def __init__(self, ids: np.ndarray, arrival_times: np.ndarray, task_lengths: np.ndarray, CPUs: np.ndarray) -> None:
+        task_lengths = np.asarray(task_lengths, dtype=float)
+        self.ID = np.asarray(ids, dtype=int)
+        self.arrival_time = np.asarray(arrival_times, dtype=float).astype(int)
+        self.task_length = task_lengths.astype(int)
+        self.task_length_class = classify_time_array(task_lengths)
+        self.CPUs = np.asarray(CPUs, dtype=float).astype(int)
+        self.CPUs_class = classify_resources_array(self.CPUs)
+        self.assign_queues()
+
+    @classmethod
+    def from_arrays(cls, ID: np.ndarray, arrival_time: np.ndarray, task_length: np.ndarray, task_length_class: np.ndarray,
+                    CPUs: np.ndarray, CPUs_class: np.ndarray) -> "TaskTable":
+        """Wrap already classified columns without copying them, e.g. arrays attached from shared memory
+
+        Args:
+            ID (np.ndarray): task IDs
+            arrival_time (np.ndarray): arrival time indices
+            task_length (np.ndarray): task lengths
+            task_length_class (np.ndarray): length classes
+            CPUs (np.ndarray): number of CPUs
+            CPUs_class (np.ndarray): resources classes
+
+        Returns:
+            TaskTable: Columnar Task trace with queues assigned from the current waiting times
+        """
+        tasks = cls.__new__(cls)
+        tasks.ID = ID
+        tasks.arrival_time = arrival_time
+        tasks.task_length = task_length
+        tasks.task_length_class = task_length_class
+        tasks.CPUs = CPUs
+        tasks.CPUs_class = CPUs_class
+        tasks.assign_queues()
+        return tasks
+
+    def assign_queues(self):
+        """Compute expected time, waiting time and queue from the current waiting times and average lengths"""
+        expected_time, waiting_time, queue = get_expected_time_array(self.task_length)
+        self.expected_time = expected_time.astype(int)
+        self.waiting_time = waiting_time.astype(int)
+        self.queue = queue
+
+    def __len__(self):
+        return len(self.ID)
+
+    def __getitem__(self, index) -> Task:
+        return Task.from_columns(
+            int(self.ID[index]),
+            int(self.arrival_time[index]),
+            int(self.task_length[index]),
+            str(self.task_length_class[index]),
+            int(self.expected_time[index]),
+            int(self.CPUs[index]),
+            str(self.CPUs_class[index]),
+            str(self.queue[index]),
+            int(self.waiting_time[index]),
+        )
+
+    def to_list(self) -> List[Task]:
+        """Build the Task objects of the whole trace
+
+        Returns:
+            List[Task]: List of Tasks
+        """
+        return [
+            Task.from_columns(*row)
+            for row in zip(
+                self.ID.tolist(),
+                self.arrival_time.tolist(),
+                self.task_length.tolist(),
+                self.task_length_class.tolist(),
+                self.expected_time.tolist(),
+                self.CPUs.tolist(),
+                self.CPUs_class.tolist(),
+                self.queue.tolist(),
+                self.waiting_time.tolist(),
+            )
+        ]
+
+
+class ArrivalStream:
+    """Cursor over a task trace that hands out, in trace order, the tasks that arrived by a given time.
+    The trace is never modified, so the same TaskTable can be replayed across experiments.
+
+    Args:
+        tasks (TaskTable): Task trace
+    """
+
+    def __init__(self, tasks: TaskTable) -> None:
+        self.tasks = tasks
+        # a task is handed out once it and every task before it arrived, like popping the head of the trace
+        self.ready_time = np.maximum.accumulate(tasks.arrival_time) if len(tasks) > 0 else tasks.arrival_time
+        self.cursor = 0
+
+    def reset(self):
+        """Rewind to the beginning of the trace"""
+        self.cursor = 0
+
+    def pop_arrived(self, current_time: int) -> List[Task]:
+        """Tasks arrived by current_time that were not handed out yet
+
+        Args:
+            current_time (int): time index
+
+        Returns:
+            List[Task]: arrived tasks in trace order
+        """
+        end = int(np.searchsorted(self.ready_time, current_time, side="right"))
+        arrived = [self.tasks[i] for i in range(self.cursor, end)]
+        self.cursor = max(self.cursor, end)
+        return arrived
+
+    def next_arrival_time(self):
+        """Time index of the next arrival
+
+        Returns:
+            int: arrival time index, None if all tasks arrived
+        """
+        if self.empty():
+            return None
+        return int(self.ready_time[self.cursor])
+
+    def empty(self):
+        return self.cursor >= len(self.tasks)
+
+    def __len__(self):
+        return len(self.tasks) - self.cursor
+
 
-def load_tasks(trace_name:str) -> List[Task]:
+def load_tasks(trace_name:str) -> TaskTable:
     """Load Task Trace
 
     Args:
         trace_name (str): trace name
 
     Returns:
-        List[Task]: List of Tasks
+        TaskTable: Columnar Task trace
     """
     print(f"Started Loading Tasks for {trace_name}")
     start = timeit.default_timer()
-    tasks = []
     df = pd.read_csv(
         f"src/cluster_traces/{trace_name}.csv")
     df["arrival_time"]/= TIME_FACTOR
@@ -148,12 +369,8 @@ def load_tasks(trace_name:str) -> List[Task]:
     ), df[df["length"] >= TwoQueues.Short.value]["length"].mean()]
     set_average_length(av_l)
     print(f"{trace_name} average {av_l[1]}")
-    # df = df[:10000]
-    #ids = df["id"].unique()
-    for id, row in df.iterrows():
-        assert row["length"] >= 300/TIME_FACTOR, "Too short Job"
-        tasks.append(Task(id, row["arrival_time"],
-                          row["length"], row["cpus"]))
-    #assert len(ids) == len(tasks)
+    assert (df["length"] >= 300/TIME_FACTOR).all(), "Too short Job"
+    tasks = TaskTable(df.index.to_numpy(), df["arrival_time"].to_numpy(),
+                      df["length"].to_numpy(), df["cpus"].to_numpy())
     print(f"Loading {trace_name} tasks took {timeit.default_timer()-start}")
     return tasks